@@ -230,8 +230,25 @@ class SpitifyApp:
                 self.root.after(0, lambda: (self.pb_stream.configure(mode="indeterminate"), self.pb_stream.start(12)))
 
         def worker():
+            # 1) si el media tiene paquete HLS, VLC lo reproduce directo (adaptativo, sin descargar todo)
+            try:
+                hls_url = self.api.signed_play(media_id).get("hls_url")
+            except Exception:
+                hls_url = None
+            if hls_url:
+                def ui_hls():
+                    self.pb_stream["mode"] = "determinate"
+                    self.pb_stream["value"] = 100
+                    self.status.set(f"Reproduciendo HLS (media {media_id})")
+                    try:
+                        self.engine.play(hls_url)
+                    except Exception as e:
+                        messagebox.showerror("Play", str(e))
+                self.root.after(0, ui_hls)
+                return
+
+            # 2) si no, descarga completa por chunks con JWT
             try:
-                # descarga completa por chunks con JWT
                 self.api.download_media(media_id, tmp_path, chunk_mb=4, progress_cb=progress_cb)
 
                 def ui_ok():
@@ -369,12 +386,13 @@ class SpitifyApp:
 
         threading.Thread(target=worker, daemon=True).start()
 
-    def on_show_media_browser(self, page: int = 1, page_size: int = 20):
+    def on_show_media_browser(self, page: int = 1, page_size: int = 20, cursor=None, _prev=None):
+            # cursor: keyset del servidor; _prev: cursores de las páginas anteriores (para "Anterior")
             if not self.auth_token:
                 messagebox.showwarning("Sesión", "Inicia sesión para ver tus medios.")
                 return
             try:
-                data = self.api.list_media(page=page, page_size=page_size)
+                data = self.api.list_media(page=page, page_size=page_size, cursor=cursor)
             except Exception as e:
                 messagebox.showerror("Medios", f"Error al consultar /media:\n{e}")
                 return
@@ -405,11 +423,29 @@ class SpitifyApp:
                     m.get("created_at", ""),
                 ))
 
-            # Pie con totales
-            meta = ttk.Label(frm, text=f"Total: {data.get('total', len(items))}  •  "
+            # Pie con totales (el total es aproximado: cacheado en el servidor)
+            bottom = ttk.Frame(frm); bottom.pack(fill="x", pady=(6, 0))
+            approx = "~" if data.get("total_approx") else ""
+            meta = ttk.Label(bottom, text=f"Total: {approx}{data.get('total', len(items))}  •  "
                                     f"page={data.get('page', page)}  size={data.get('page_size', page_size)}",
                             style="Muted.TLabel")
-            meta.pack(anchor="w", pady=(6, 0))
+            meta.pack(side="left")
+
+            prev = list(_prev or [])
+            next_cursor = data.get("next_cursor")
+
+            def _go_next():
+                win.destroy()
+                self.on_show_media_browser(page + 1, page_size, next_cursor, prev + [cursor])
+
+            def _go_prev():
+                win.destroy()
+                self.on_show_media_browser(page - 1, page_size, prev[-1], prev[:-1])
+
+            ttk.Button(bottom, text="Siguiente ▶", command=_go_next,
+                       state="normal" if next_cursor else "disabled").pack(side="right")
+            ttk.Button(bottom, text="◀ Anterior", command=_go_prev,
+                       state="normal" if prev else "disabled").pack(side="right", padx=(0, 6))
 
             # (Opcional) doble click para copiar el ID al Media ID de la pantalla principal
             def _on_dclick(_event=None):
@@ -493,7 +529,8 @@ class SpitifyApp:
             try:
                 job = self.api.create_job(
                     job_type="convert",
-                    payload={"media_id": media_id, "target_ext": target_ext}
+                    payload={"media_id": media_id, "target_ext": target_ext},
+                    priority=10,  # interactivo: no espera detrás de lotes
                 )
                 jid = job.get("id") or job.get("job_id")
                 if not jid:
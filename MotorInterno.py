@@ -1,9 +1,12 @@
 # Motor Interno Spitify Proyecto II de SO, Descargar vlc y bilbioteca python-vlc antes de usar
 import os
+import json
 import time
 import platform
 import shutil
 import subprocess
+import threading
+from collections import deque
 from pathlib import Path
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
@@ -92,14 +95,173 @@ try:
 except Exception as e:
     FFMPEG_ERROR = str(e)
 
+def find_ffprobe_path() -> str | None:
+    """ffprobe junto a ffmpeg (mismo directorio) o en el PATH."""
+    if FFMPEG_BIN:
+        p = Path(FFMPEG_BIN)
+        sib = p.with_name("ffprobe" + p.suffix)
+        if sib.exists():
+            return str(sib)
+    return shutil.which("ffprobe")
+
+FFPROBE_BIN = find_ffprobe_path()
+
+def ffprobe_json(inp: Path) -> dict:
+    """Salida JSON de ffprobe (format + streams). {} si ffprobe no está o falla."""
+    if not FFPROBE_BIN:
+        return {}
+    cmd = [FFPROBE_BIN, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", str(inp)]
+    try:
+        res = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=60)
+        return json.loads(res.stdout or b"{}") if res.returncode == 0 else {}
+    except Exception:
+        return {}
+
+def probe_duration(inp: Path) -> float | None:
+    """Duración en segundos (format.duration de ffprobe) o None si no se conoce."""
+    try:
+        d = float(ffprobe_json(inp).get("format", {}).get("duration") or 0)
+        return d if d > 0 else None
+    except (TypeError, ValueError):
+        return None
+
+def _int_or_none(v) -> int | None:
+    try:
+        return int(float(v))
+    except (TypeError, ValueError):
+        return None
+
+# etiquetas del contenedor que se indexan para la búsqueda (título, artista, ...)
+SEARCH_TAGS = ("title", "artist", "album_artist", "album", "genre", "composer", "show", "comment")
+MAX_TAGS_LEN = 1000
+
+def probe_media(inp: Path) -> dict | None:
+    """
+    Metadatos resumidos para indexar: duración, contenedor, bitrate, códecs,
+    resolución, sample rate, canales y etiquetas de texto (SEARCH_TAGS).
+    None si ffprobe no pudo leer el archivo.
+    """
+    info = ffprobe_json(inp)
+    if not info:
+        return None
+    fmt = info.get("format", {})
+    streams = info.get("streams", [])
+    v = next((s for s in streams if s.get("codec_type") == "video"
+              and not (s.get("disposition") or {}).get("attached_pic")), None)
+    a = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    try:
+        duration = float(fmt.get("duration") or 0) or None
+    except (TypeError, ValueError):
+        duration = None
+    # las claves varían de mayúsculas según el contenedor (TITLE en mkv, title en mp4)
+    fmt_tags = {str(k).lower(): str(v).strip() for k, v in (fmt.get("tags") or {}).items()}
+    tags = " ".join(fmt_tags[k] for k in SEARCH_TAGS if fmt_tags.get(k))[:MAX_TAGS_LEN] or None
+    return {
+        "duration_sec": duration,
+        "format_name": (fmt.get("format_name") or "")[:64] or None,
+        "bit_rate": _int_or_none(fmt.get("bit_rate")),
+        "video_codec": v.get("codec_name") if v else None,
+        "width": _int_or_none(v.get("width")) if v else None,
+        "height": _int_or_none(v.get("height")) if v else None,
+        "audio_codec": a.get("codec_name") if a else None,
+        "sample_rate": _int_or_none(a.get("sample_rate")) if a else None,
+        "channels": _int_or_none(a.get("channels")) if a else None,
+        "tags": tags,
+    }
+
+# -------- Progreso de FFmpeg (-progress pipe:1) ----------
+def _parse_speed(v: str) -> float | None:
+    try:
+        return float(v.strip().rstrip("x"))
+    except ValueError:
+        return None
+
+def _parse_progress_block(kv: dict, duration: float | None) -> dict:
+    """Bloque key=value de -progress -> {out_time, pct, speed, fps, bitrate, eta_sec, done}."""
+    out_us = kv.get("out_time_us") or kv.get("out_time_ms")  # ambos vienen en microsegundos
+    try:
+        out_time = max(0.0, int(out_us) / 1_000_000) if out_us not in (None, "N/A") else None
+    except ValueError:
+        out_time = None
+    speed = _parse_speed(kv.get("speed", ""))
+    try:
+        fps = float(kv.get("fps", ""))
+    except ValueError:
+        fps = None
+    pct = None
+    eta = None
+    if duration and out_time is not None:
+        pct = max(0.0, min(100.0, 100.0 * out_time / duration))
+        if speed:
+            eta = max(0.0, (duration - out_time) / speed)
+    return {
+        "out_time": out_time, "pct": pct, "speed": speed, "fps": fps,
+        "bitrate": kv.get("bitrate"), "eta_sec": eta, "done": kv.get("progress") == "end",
+    }
+
+STDERR_RING_LINES = 200  # líneas de stderr que se conservan en memoria por ejecución
+
+def _drain_stderr(pipe, ring: deque, log_path: Path | None):
+    """Lee stderr línea a línea: últimas líneas en el ring y, si hay log_path, todo a disco."""
+    log = open(log_path, "ab") if log_path else None
+    try:
+        for raw in pipe:
+            ring.append(raw)
+            if log:
+                log.write(raw)
+    finally:
+        if log:
+            log.close()
+
+def _run_ffmpeg_progress(cmd: list, duration: float | None, on_progress=None, log_path: Path | None = None) -> tuple[int, str]:
+    """
+    Ejecuta FFmpeg con -progress pipe:1 y llama on_progress(dict) por cada bloque.
+    stderr se drena en un hilo hacia un ring buffer acotado (y a log_path completo, opcional).
+    Devuelve (returncode, stderr_tail).
+    """
+    cmd = [cmd[0], "-nostats", "-progress", "pipe:1"] + cmd[1:]
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError as e:
+        raise RuntimeError(f"No se pudo ejecutar FFmpeg en: {FFMPEG_BIN}. Error: {e}")
+
+    if log_path:
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(log_path, "ab") as log:
+            log.write(("$ " + " ".join(str(c) for c in cmd) + "\n").encode("utf-8", "ignore"))
+    ring = deque(maxlen=STDERR_RING_LINES)
+    t_err = threading.Thread(target=_drain_stderr, args=(proc.stderr, ring, log_path), daemon=True)
+    t_err.start()
+
+    kv = {}
+    for raw in proc.stdout:
+        line = raw.decode("utf-8", "ignore").strip()
+        if "=" not in line:
+            continue
+        k, v = line.split("=", 1)
+        kv[k] = v
+        if k == "progress":
+            if on_progress:
+                try:
+                    on_progress(_parse_progress_block(kv, duration))
+                except Exception:
+                    pass  # el callback nunca debe romper la conversión
+            kv = {}
+
+    proc.wait()
+    t_err.join()
+    return proc.returncode, b"".join(ring).decode("utf-8", "ignore")[-800:]
+
 # -------- Conversión----------
-def run_ffmpeg_convert(inp: Path, out: Path) -> dict:
+def run_ffmpeg_convert(inp: Path, out: Path, on_progress=None, log_path: Path | None = None) -> dict:
     """Convierte usando FFmpeg.
        Soporta:
          - audio -> audio
          - video -> video
          - audio -> (mp4/webm/mkv) como audio-only
          - video -> audio (extracción)
+       on_progress(dict) opcional: out_time, pct, speed, fps, bitrate, eta_sec, done.
+       log_path opcional: stderr completo de FFmpeg se agrega a ese archivo.
     """
     t0 = time.time()
     out.parent.mkdir(parents=True, exist_ok=True)
@@ -158,24 +320,120 @@ def run_ffmpeg_convert(inp: Path, out: Path) -> dict:
 
     cmd = [FFMPEG_BIN, "-y", "-i", str(inp)] + args + [str(out)]
 
-    try:
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except FileNotFoundError as e:
-        raise RuntimeError(f"No se pudo ejecutar FFmpeg en: {FFMPEG_BIN}. Error: {e}")
-
-    stdout, stderr = proc.communicate()
-    ok = proc.returncode == 0 and out.exists()
+    duration = probe_duration(inp) if on_progress else None
+    returncode, stderr_tail = _run_ffmpeg_progress(cmd, duration, on_progress, log_path)
+    ok = returncode == 0 and out.exists()
     dt = round(time.time() - t0, 3)
     return {
         "ok": ok,
         "seconds": dt,
         "input": str(inp),
         "output": str(out),
-        "stderr_tail": stderr.decode("utf-8", "ignore")[-800:],
+        "duration": duration,
+        "stderr_tail": stderr_tail,
         "ffmpeg_path": FFMPEG_BIN,
         "in_type": in_type, "out_type": out_type, "in_ext": in_ext, "out_ext": out_ext
     }
 
+# -------- Empaquetado HLS (streaming adaptativo) ----------
+# (nombre, alto, bitrate video, bitrate audio)
+HLS_VIDEO_LADDER = [("360p", 360, "800k", "96k"), ("720p", 720, "2800k", "128k"), ("1080p", 1080, "5000k", "160k")]
+# (nombre, bitrate audio)
+HLS_AUDIO_LADDER = [("a64", "64k"), ("a128", "128k"), ("a192", "192k")]
+HLS_SEGMENT_SEC = 4
+# CODECS del master: H.264 High@4.2 (fijado en los args) y AAC-LC
+HLS_VIDEO_CODEC = "avc1.64002a"
+HLS_AUDIO_CODEC = "mp4a.40.2"
+
+def _kbps(rate: str) -> int:
+    return int(rate.rstrip("k")) * 1000
+
+def run_ffmpeg_hls(inp: Path, out_dir: Path, segment_sec: int = HLS_SEGMENT_SEC, on_progress=None,
+                   log_path: Path | None = None) -> dict:
+    """Genera HLS multi-bitrate en out_dir:
+         out_dir/master.m3u8
+         out_dir/<rendición>/index.m3u8 + seg_00000.ts ...
+       Video: escalera 360p/720p/1080p (sin escalar hacia arriba). Audio: AAC 64/128/192k.
+       on_progress(dict) opcional, con pct global sobre todas las rendiciones.
+       log_path opcional: stderr de todas las rendiciones se agrega a ese archivo.
+    """
+    t0 = time.time()
+    if FFMPEG_ERROR:
+        raise RuntimeError(f"No se puede empaquetar: {FFMPEG_ERROR}")
+
+    in_type = media_type_by_ext(inp.suffix)
+    if in_type == "unknown":
+        raise ValueError(f"Formato de entrada no soportado: {inp.suffix}")
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    info = ffprobe_json(inp)
+    vstreams = [s for s in info.get("streams", []) if s.get("codec_type") == "video"]
+    has_video = in_type == "video" and (bool(vstreams) or not info)
+    src_h = int(vstreams[0].get("height") or 0) if vstreams else 0
+    src_w = int(vstreams[0].get("width") or 0) if vstreams else 0
+    has_audio = any(s.get("codec_type") == "audio" for s in info.get("streams", [])) or not info
+
+    variants = []  # (nombre, args ffmpeg, bandwidth, atributos extra de EXT-X-STREAM-INF)
+    if has_video:
+        ladder = [r for r in HLS_VIDEO_LADDER if not src_h or r[1] <= src_h] or HLS_VIDEO_LADDER[:1]
+        codecs = f"{HLS_VIDEO_CODEC},{HLS_AUDIO_CODEC}" if has_audio else HLS_VIDEO_CODEC
+        for name, height, vb, ab in ladder:
+            # ancho como scale=-2 (par, manteniendo aspecto); sin datos del fuente se asume 16:9
+            width = 2 * round((src_w * height / src_h if src_w and src_h else height * 16 / 9) / 2)
+            args = ["-vf", f"scale=-2:{height}", "-c:v", "libx264", "-preset", "veryfast",
+                    "-profile:v", "high", "-level:v", "4.2", "-pix_fmt", "yuv420p",
+                    "-b:v", vb, "-maxrate", vb, "-bufsize", str(2 * _kbps(vb)),
+                    # keyframe exacto en cada borde de segmento (cualquier fps): rendiciones alineadas para ABR
+                    "-force_key_frames", f"expr:gte(t,n_forced*{segment_sec})", "-sc_threshold", "0",
+                    "-c:a", "aac", "-b:a", ab, "-ac", "2"]
+            variants.append((name, args, int((_kbps(vb) + _kbps(ab)) * 1.1),
+                             f'RESOLUTION={width}x{height},CODECS="{codecs}"'))
+    else:
+        for name, ab in HLS_AUDIO_LADDER:
+            variants.append((name, ["-vn", "-c:a", "aac", "-b:a", ab], int(_kbps(ab) * 1.1),
+                             f'CODECS="{HLS_AUDIO_CODEC}"'))
+
+    duration = None
+    try:
+        duration = float(info.get("format", {}).get("duration") or 0) or None
+    except (TypeError, ValueError):
+        pass
+
+    for i, (name, args, _bw, _attrs) in enumerate(variants):
+        vdir = out_dir / name
+        vdir.mkdir(parents=True, exist_ok=True)
+        cmd = [FFMPEG_BIN, "-y", "-i", str(inp)] + args + [
+            "-f", "hls", "-hls_time", str(segment_sec), "-hls_playlist_type", "vod",
+            "-hls_segment_filename", str(vdir / "seg_%05d.ts"), str(vdir / "index.m3u8"),
+        ]
+
+        def variant_progress(p, i=i):
+            # cada rendición pesa 1/n del total
+            if on_progress and p.get("pct") is not None:
+                on_progress({**p, "pct": (i * 100.0 + p["pct"]) / len(variants), "variant": name})
+
+        returncode, stderr_tail = _run_ffmpeg_progress(cmd, duration, variant_progress, log_path)
+        if returncode != 0:
+            return {
+                "ok": False, "seconds": round(time.time() - t0, 3), "output": str(out_dir),
+                "failed_variant": name, "stderr_tail": stderr_tail,
+            }
+
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for name, _args, bw, attrs in variants:
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bw},{attrs}")
+        lines.append(f"{name}/index.m3u8")
+    (out_dir / "master.m3u8").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    return {
+        "ok": True,
+        "seconds": round(time.time() - t0, 3),
+        "input": str(inp),
+        "output": str(out_dir),
+        "variants": [name for name, *_ in variants],
+        "ffmpeg_path": FFMPEG_BIN,
+    }
+
 # -------- Reproductor----------
 try:
     import vlc  # requiere VLC instalado
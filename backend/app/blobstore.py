@@ -0,0 +1,107 @@
+# app/blobstore.py
+"""
+Almacén direccionado por contenido (sha256).
+- Cada contenido se guarda una sola vez en MEDIA_ROOT/blobs/ab/cd/<sha256>.
+- MediaFile.storage_path apunta al blob; varios MediaFile pueden compartirlo.
+- Blob.refcount cuenta las referencias; al llegar a 0 se borra el archivo.
+"""
+import os
+import hashlib
+from uuid import uuid4
+from pathlib import Path
+
+from sqlalchemy.orm import Session
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from .config import settings
+from .models import Blob
+
+HASH_CHUNK = 1024 * 1024
+
+def blob_rel_path(sha256: str) -> str:
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+def blob_abs_path(sha256: str) -> Path:
+    return Path(settings.media_root).resolve() / blob_rel_path(sha256)
+
+def sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(HASH_CHUNK)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+def find_blob(db: Session, sha256: str) -> Blob | None:
+    return db.get(Blob, sha256.lower())
+
+def acquire_blob(db: Session, sha256: str) -> Blob | None:
+    """Suma una referencia a un blob existente (no hace commit). None si no existe."""
+    sha256 = sha256.lower()
+    res = db.execute(update(Blob).where(Blob.sha256 == sha256).values(refcount=Blob.refcount + 1))
+    if not res.rowcount:
+        return None
+    return db.get(Blob, sha256)
+
+def store_blob(db: Session, src: Path, sha256: str, size: int, mime: str | None) -> Blob:
+    """
+    Mueve src al almacén (o lo descarta si el contenido ya existe) y suma una referencia.
+    Hace commit de la fila del blob; el MediaFile que lo referencia lo agrega el llamador.
+    """
+    sha256 = sha256.lower()
+    blob = acquire_blob(db, sha256)
+    if blob:
+        db.commit()
+        _unlink(src)
+        return blob
+
+    dst = blob_abs_path(sha256)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(src, dst)
+    blob = Blob(sha256=sha256, rel_path=blob_rel_path(sha256), size_bytes=size, mime=mime, refcount=1)
+    db.add(blob)
+    try:
+        db.commit()
+    except IntegrityError:
+        # otro upload del mismo contenido ganó la carrera: el archivo es idéntico
+        db.rollback()
+        blob = acquire_blob(db, sha256)
+        db.commit()
+    return blob
+
+def release_blob(db: Session, sha256: str) -> Path | None:
+    """
+    Resta una referencia (no hace commit). Si llega a 0 borra la fila y, todavía con la
+    fila bloqueada, saca el archivo de su ruta (rename a un nombre de descarte): un
+    store_blob concurrente del mismo contenido espera el lock y luego escribe un archivo
+    nuevo en la ruta libre, que el borrado ya no toca. Devuelve el descarte para que el
+    llamador lo elimine tras el commit.
+    """
+    sha256 = sha256.lower()
+    # el UPDATE toma el lock de la fila hasta el commit del llamador
+    db.execute(update(Blob).where(Blob.sha256 == sha256, Blob.refcount > 0).values(refcount=Blob.refcount - 1))
+    blob = db.get(Blob, sha256, populate_existing=True)
+    if not blob or blob.refcount > 0:
+        return None
+    db.delete(blob)
+    db.flush()
+    path = blob_abs_path(sha256)
+    trash = path.with_name(f"{path.name}.del-{uuid4().hex}")
+    try:
+        os.replace(path, trash)
+    except OSError:
+        return None
+    return trash
+
+def discard_file(path: Path | None):
+    if path is not None:
+        _unlink(path)
+
+def _unlink(path: Path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
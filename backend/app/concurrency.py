@@ -0,0 +1,66 @@
+# app/concurrency.py
+"""
+Concurrencia adaptativa por nodo (AIMD), recalculada en cada heartbeat.
+- Node.slots es el máximo que anuncia el worker; Node.conc_limit es cuántos jobs
+  le deja correr el coordinador ahora (ventana, como cwnd en TCP).
+- Slow start: mientras conc_limit < conc_ssthresh la ventana se duplica; luego +1.
+- Sólo crece si la ventana está en uso, la CPU promedio y la memoria están bajo el
+  objetivo y el rendimiento agregado (throughput * running) mejoró con el último aumento.
+- Con CPU o memoria sobre el umbral alto se multiplica por BETA (con un cooldown para
+  no colapsar por varios heartbeats seguidos) y ssthresh queda en el nuevo valor.
+"""
+import math
+from datetime import datetime
+
+from .models import Node
+
+CPU_TARGET = 80.0
+MEM_TARGET = 75.0
+CPU_HIGH = 92.0
+MEM_HIGH = 85.0
+MEM_CRITICAL = 95.0     # freno duro: no asignar nada (swap)
+CPU_ALPHA = 0.3         # EWMA de CPU: psutil.cpu_percent es ruidoso
+BETA = 0.7
+INCREASE_EVERY_SEC = 20
+DECREASE_COOLDOWN_SEC = 10
+MIN_GAIN = 0.95         # aumento sin ganancia de rendimiento => se revierte
+
+def allowed_slots(n: Node) -> int:
+    """Jobs simultáneos permitidos ahora para el nodo."""
+    return max(1, min(n.slots or 1, math.floor(n.conc_limit or 1.0)))
+
+def is_critical(n: Node) -> bool:
+    return n.mem_pct is not None and n.mem_pct > MEM_CRITICAL
+
+def aimd_update(n: Node, running: int | None, now: datetime | None = None):
+    """Ajusta n.conc_limit con las métricas recién recibidas (no hace commit)."""
+    now = now or datetime.utcnow()
+    cap = max(1, n.slots or 1)
+    limit = min(float(cap), max(1.0, n.conc_limit or 1.0))
+    if n.cpu_pct is not None:
+        n.cpu_avg = n.cpu_pct if n.cpu_avg is None else (1 - CPU_ALPHA) * n.cpu_avg + CPU_ALPHA * n.cpu_pct
+    cpu = n.cpu_avg or 0.0
+    mem = n.mem_pct or 0.0
+    since = (now - n.conc_changed_at).total_seconds() if n.conc_changed_at else math.inf
+
+    if cpu > CPU_HIGH or mem > MEM_HIGH:
+        # decremento multiplicativo
+        if since >= DECREASE_COOLDOWN_SEC and limit > 1.0:
+            limit = max(1.0, limit * BETA)
+            n.conc_ssthresh = limit
+            n.conc_ref_rate = None
+            n.conc_changed_at = now
+    elif (running or 0) >= math.floor(limit) and cpu < CPU_TARGET and mem < MEM_TARGET \
+            and since >= INCREASE_EVERY_SEC:
+        rate = (n.throughput or 1.0) * (running or 0)
+        if n.conc_ref_rate and rate < n.conc_ref_rate * MIN_GAIN and limit > 1.0:
+            # más jobs no rindieron más: se vuelve atrás y se fija el techo
+            limit -= 1.0
+            n.conc_ssthresh = limit
+            n.conc_ref_rate = None
+        elif limit < cap:
+            n.conc_ref_rate = rate
+            ssthresh = n.conc_ssthresh or float(cap)
+            limit = min(float(cap), limit * 2 if limit < ssthresh else limit + 1.0)
+        n.conc_changed_at = now
+    n.conc_limit = limit
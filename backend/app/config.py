@@ -10,10 +10,36 @@ class Settings(BaseSettings):
     node_name: str = "worker-1"
 
     coord_url: str = "http://127.0.0.1:8000" 
+    # URL de la API (esta misma app) que corre en este nodo, si corre una: los demás nodos
+    # bajan de ahí los media cuyo home es este nodo. "" => las fuentes las sirve el coordinador
+    node_api_url: str = ""
     heartbeat_sec: int = 3 
     ffmpeg_path: str = ""
+    worker_slots: int = 0  # jobs simultáneos por nodo (0 => os.cpu_count())
     public_base_url: str = "http://127.0.0.1:8000"
 
+    # logs de FFmpeg por job ("" => MEDIA_ROOT/logs/jobs)
+    job_log_dir: str = ""
+
+    # leases de jobs: vigencia, reintentos y backoff exponencial al re-encolar
+    job_lease_sec: int = 60
+    job_max_attempts: int = 5
+    job_backoff_base_sec: int = 5
+    job_backoff_max_sec: int = 600
+    reaper_every_sec: int = 15
+    # localidad: segundos que un job espera a un nodo que tenga el media antes de ir a otro
+    locality_wait_sec: int = 30
+    # estado de nodos en memoria: cada cuánto se persiste/recarga la tabla nodes
+    node_flush_sec: float = 2.0
+
+    # uploads por partes: tamaño máximo declarado y cada cuánto se borran sesiones vencidas
+    max_upload_bytes: int = 50 * 1024 ** 3
+    upload_gc_every_sec: int = 600
+
+    # streaming: máximo de streams simultáneos (0 = sin límite) e hilos dedicados a lecturas
+    max_streams: int = 256
+    stream_io_threads: int = 16
+
     class Config:
         env_file = ".env"
 
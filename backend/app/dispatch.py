@@ -0,0 +1,112 @@
+# app/dispatch.py
+"""
+Aviso de "hay jobs nuevos" para el long-poll de /worker/next_job.
+- JOB_NOTIFIER despierta a los next_job que esperan en este proceso.
+- Con Postgres, create_job además emite NOTIFY jobs_queued (se entrega al hacer commit)
+  y un hilo LISTEN por proceso reenvía el aviso al notifier local: sirve con varios
+  workers de uvicorn o varias réplicas del coordinador.
+"""
+import asyncio
+import select as _select
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .db import engine
+
+PG_CHANNEL = "jobs_queued"
+
+class JobNotifier:
+    """
+    Contador de generación + futures del event loop.
+    notify() es thread-safe (los handlers sync corren en el threadpool).
+    """
+    def __init__(self):
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._waiters: set[asyncio.Future] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def notify(self):
+        with self._lock:
+            self.generation += 1
+            loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake_all)
+
+    def _wake_all(self):
+        waiters, self._waiters = self._waiters, set()
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(True)
+
+    async def wait(self, since: int, timeout: float) -> bool:
+        """
+        Espera un notify() posterior a la generación `since`.
+        True => hubo aviso (quizá antes de empezar a esperar); False => timeout.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._loop = loop
+            if self.generation != since:
+                return True
+        fut = loop.create_future()
+        self._waiters.add(fut)
+        try:
+            await asyncio.wait_for(fut, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiters.discard(fut)
+
+JOB_NOTIFIER = JobNotifier()
+
+def _is_postgres() -> bool:
+    return engine.dialect.name == "postgresql"
+
+def announce_jobs(db: Session):
+    """
+    Llamar antes del commit que encola jobs. En Postgres el NOTIFY viaja con la
+    transacción (si hay rollback no se envía). El aviso local lo da notify_local().
+    """
+    if _is_postgres():
+        db.execute(text(f"NOTIFY {PG_CHANNEL}"))
+
+def notify_local():
+    JOB_NOTIFIER.notify()
+
+# === LISTEN (Postgres) ===
+
+_listener: threading.Thread | None = None
+
+def _listen_loop():
+    while True:
+        try:
+            raw = engine.raw_connection()
+            try:
+                conn = raw.driver_connection  # psycopg2
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {PG_CHANNEL}")
+                while True:
+                    if _select.select([conn], [], [], 30.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        JOB_NOTIFIER.notify()
+            finally:
+                raw.invalidate()
+        except Exception as e:
+            print("[dispatch] LISTEN error:", e)
+        threading.Event().wait(2.0)
+
+def start_pg_listener():
+    """Arranca (una vez por proceso) el hilo LISTEN si la base es Postgres."""
+    global _listener
+    if _listener is not None or not _is_postgres():
+        return
+    _listener = threading.Thread(target=_listen_loop, name="jobs-listen", daemon=True)
+    _listener.start()
@@ -0,0 +1,107 @@
+# app/leases.py
+"""
+Leases de jobs 'running'.
+- next_job fija lease_expires_at = ahora + JOB_LEASE_SEC y suma attempts.
+- El worker lo renueva con /worker/jobs/{id}/progress y con cada heartbeat
+  (los heartbeats se acumulan y se aplican en lote en el flush de NODES).
+- El reaper re-encola los leases vencidos (worker caído) con backoff exponencial
+  en not_before; al agotar JOB_MAX_ATTEMPTS el job queda 'failed'.
+"""
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import SessionLocal
+from .models import Job
+
+def lease_until(now: datetime | None = None) -> datetime:
+    return (now or datetime.utcnow()) + timedelta(seconds=settings.job_lease_sec)
+
+def backoff_sec(attempts: int) -> int:
+    """5, 10, 20, 40... segundos (con tope) según intentos ya consumidos."""
+    exp = max(0, attempts - 1)
+    return min(settings.job_backoff_max_sec, settings.job_backoff_base_sec * (2 ** min(exp, 20)))
+
+def extend_leases_bulk(db: Session, pending: dict[int, list[int] | None]) -> int:
+    """
+    Renueva en lote los leases acumulados de varios heartbeats (no hace commit).
+    pending: node_id -> ids que el worker reportó (None => todos los 'running' del nodo).
+    """
+    until = lease_until()
+    n = 0
+    explicit = [{"jid": jid, "nid": nid} for nid, ids in pending.items() if ids for jid in set(ids)]
+    if explicit:
+        t = Job.__table__
+        stmt = (
+            update(t)
+            .where(t.c.id == bindparam("jid"), t.c.assigned_node_id == bindparam("nid"), t.c.status == "running")
+            .values(lease_expires_at=until)
+        )
+        n += db.connection().execute(stmt, explicit).rowcount or 0
+    legacy = [nid for nid, ids in pending.items() if ids is None]
+    if legacy:
+        n += db.execute(
+            update(Job).where(Job.assigned_node_id.in_(legacy), Job.status == "running")
+            .values(lease_expires_at=until)
+        ).rowcount or 0
+    return n
+
+def reap_expired_leases(db: Session) -> dict:
+    """Re-encola (o falla) los jobs cuyo lease venció. Hace commit."""
+    now = datetime.utcnow()
+    rows = db.scalars(
+        select(Job)
+        .where(Job.status == "running", Job.lease_expires_at != None, Job.lease_expires_at < now)
+        .with_for_update(skip_locked=True)
+    ).all()
+    requeued = failed = 0
+    for j in rows:
+        node_id = j.assigned_node_id
+        if (j.attempts or 0) >= settings.job_max_attempts:
+            j.status = "failed"
+            j.error = f"Lease vencido (nodo {node_id}) tras {j.attempts} intentos"
+            j.finished_at = now
+            failed += 1
+        else:
+            j.status = "queued"
+            j.not_before = now + timedelta(seconds=backoff_sec(j.attempts or 0))
+            j.error = f"Lease vencido (nodo {node_id}); reintento {j.attempts + 1}"
+            requeued += 1
+        j.assigned_node_id = None
+        j.lease_expires_at = None
+        j.started_at = None
+        j.progress = 0.0
+        j.speed = None
+        j.eta_sec = None
+    # sin aviso a los long-poll: not_before está en el futuro y los workers re-consultan solos
+    db.commit()
+    return {"requeued": requeued, "failed": failed}
+
+# === Reaper en segundo plano ===
+
+_reaper: threading.Thread | None = None
+
+def _reaper_loop():
+    stop = threading.Event()
+    while not stop.wait(max(1, settings.reaper_every_sec)):
+        db = SessionLocal()
+        try:
+            res = reap_expired_leases(db)
+            if res["requeued"] or res["failed"]:
+                print("[reaper] leases vencidos:", res)
+        except Exception as e:
+            db.rollback()
+            print("[reaper] error:", e)
+        finally:
+            db.close()
+
+def start_reaper():
+    """Un hilo por proceso; con varias réplicas SKIP LOCKED evita procesar dos veces."""
+    global _reaper
+    if _reaper is not None or settings.reaper_every_sec <= 0:
+        return
+    _reaper = threading.Thread(target=_reaper_loop, name="lease-reaper", daemon=True)
+    _reaper.start()
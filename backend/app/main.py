@@ -13,21 +13,39 @@ from .routers import monitor_jobs as monitor_jobs_router
 from .routers import monitor_sessions as monitor_sessions_router
 from .routers import media_signed as media_signed_router
 from .routers import users as users_router
+from .routers import uploads as uploads_router
+from .dispatch import start_pg_listener
+from .leases import start_reaper
+from .node_registry import start_node_registry
+from .search import init_search
+from .migrate import upgrade_schema
 from fastapi.middleware.cors import CORSMiddleware
 
 def create_app() -> FastAPI:
     app = FastAPI(title="Multimedia API - Sprint 4")
     # (Opcional) Crear tablas en arranque: para desarrollo/POC
     Base.metadata.create_all(bind=engine)
+    # columnas/índices nuevos en tablas existentes (create_all no las altera)
+    upgrade_schema()
+    # pg_trgm + índices GIN para /media/search (en SQLite: índice en memoria)
+    init_search()
+    # LISTEN jobs_queued para el long-poll de /worker/next_job (sólo Postgres)
+    app.add_event_handler("startup", start_pg_listener)
+    # re-encola jobs con lease vencido (workers caídos)
+    app.add_event_handler("startup", start_reaper)
+    # estado de nodos en memoria + persistencia periódica
+    app.add_event_handler("startup", start_node_registry)
+    # borra sesiones de upload vencidas y sus .part
+    app.add_event_handler("startup", uploads_router.start_upload_gc)
 
     # CORS
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],  # o restringe a tu front
         allow_credentials=True,
-        allow_methods=["GET", "POST", "OPTIONS"],
+        allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
         allow_headers=["*"],
-        expose_headers=["Content-Range","Accept-Ranges","Content-Length","Content-Type"]
+        expose_headers=["Content-Range","Accept-Ranges","Content-Length","Content-Type","ETag","Last-Modified"]
     )
 
     app.include_router(auth_router.router)
@@ -49,6 +67,7 @@ def create_app() -> FastAPI:
     app.include_router(monitor_sessions_router.router)   
     app.include_router(media_signed_router.router)
     app.include_router(users_router.router)
+    app.include_router(uploads_router.router)
 
     return app
 
@@ -0,0 +1,127 @@
+# app/metrics.py
+"""
+Series de tiempo de telemetría de nodos (CPU, memoria, red).
+- Por nodo, en memoria: anillo de muestras crudas (cada heartbeat, ~10 min) y
+  buckets de 1 minuto en curso.
+- Al cerrar un minuto el bucket se reduce a un punto (promedio/máximo/tasas) y queda
+  pendiente; el flusher de NODES los inserta en node_metrics en un solo INSERT.
+- Con varios procesos cada uno escribe su parte del minuto con su cantidad de muestras;
+  la lectura combina por promedio ponderado.
+"""
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, insert, func
+from sqlalchemy.orm import Session
+
+from .models import NodeMetric
+
+RAW_POINTS = 200                 # ~10 min con HEARTBEAT_SEC=3
+RETENTION_HOURS = 48
+PRUNE_EVERY_SEC = 600
+
+class NodeSeries:
+    def __init__(self):
+        self.raw: deque[dict] = deque(maxlen=RAW_POINTS)
+        self._bucket_ts: datetime | None = None
+        self._bucket: list[dict] = []
+        self._prev: tuple[datetime, int, int] | None = None
+
+    def add(self, ts: datetime, cpu, mem, net_in, net_out) -> dict | None:
+        """Agrega una muestra; devuelve el punto del minuto que se cerró (si hubo)."""
+        rx = tx = None
+        if net_in is not None and net_out is not None:
+            if self._prev:
+                pts, pin, pout = self._prev
+                dt = (ts - pts).total_seconds()
+                # contadores acumulados del worker: si bajan, el worker reinició
+                if dt > 0 and net_in >= pin and net_out >= pout:
+                    rx, tx = (net_in - pin) / dt, (net_out - pout) / dt
+            self._prev = (ts, net_in, net_out)
+        sample = {"ts": ts, "cpu": cpu, "mem": mem, "rx_bps": rx, "tx_bps": tx}
+        self.raw.append(sample)
+
+        minute = ts.replace(second=0, microsecond=0)
+        closed = None
+        if self._bucket_ts is not None and minute != self._bucket_ts:
+            closed = self._close()
+        self._bucket_ts = minute
+        self._bucket.append(sample)
+        return closed
+
+    def _close(self) -> dict | None:
+        pts, ts = self._bucket, self._bucket_ts
+        self._bucket, self._bucket_ts = [], None
+        if not pts:
+            return None
+
+        def avg(key):
+            vals = [p[key] for p in pts if p[key] is not None]
+            return sum(vals) / len(vals) if vals else None
+
+        cpus = [p["cpu"] for p in pts if p["cpu"] is not None]
+        return {
+            "ts": ts, "samples": len(pts),
+            "cpu_avg": avg("cpu"), "cpu_max": max(cpus) if cpus else None,
+            "mem_avg": avg("mem"), "rx_bps": avg("rx_bps"), "tx_bps": avg("tx_bps"),
+        }
+
+class MetricsStore:
+    def __init__(self):
+        self._series: dict[int, NodeSeries] = {}
+        self._pending: list[dict] = []
+        self._lock = threading.Lock()
+        self._last_prune = datetime.min
+
+    def record(self, node_id: int, ts: datetime, cpu, mem, net_in, net_out):
+        with self._lock:
+            series = self._series.setdefault(node_id, NodeSeries())
+            point = series.add(ts, cpu, mem, net_in, net_out)
+            if point:
+                self._pending.append({"node_id": node_id, **point})
+
+    def raw(self, node_id: int, since: datetime) -> list[dict]:
+        with self._lock:
+            series = self._series.get(node_id)
+            return [p for p in series.raw if p["ts"] >= since] if series else []
+
+    def flush(self, db: Session) -> int:
+        """Inserta los minutos cerrados y poda lo viejo de vez en cuando (hace commit)."""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        now = datetime.utcnow()
+        prune = (now - self._last_prune).total_seconds() >= PRUNE_EVERY_SEC
+        if rows:
+            db.execute(insert(NodeMetric), rows)
+        if prune:
+            self._last_prune = now
+            db.execute(delete(NodeMetric).where(NodeMetric.ts < now - timedelta(hours=RETENTION_HOURS)))
+        if rows or prune:
+            db.commit()
+        return len(rows)
+
+METRICS = MetricsStore()
+
+def minute_series(db: Session, node_id: int, since: datetime) -> list[dict]:
+    """Puntos de 1 minuto desde la DB, combinando los parciales de cada proceso."""
+    w = func.sum(NodeMetric.samples)
+    rows = db.execute(
+        select(
+            NodeMetric.ts,
+            w,
+            func.sum(NodeMetric.cpu_avg * NodeMetric.samples) / w,
+            func.max(NodeMetric.cpu_max),
+            func.sum(NodeMetric.mem_avg * NodeMetric.samples) / w,
+            func.sum(NodeMetric.rx_bps * NodeMetric.samples) / w,
+            func.sum(NodeMetric.tx_bps * NodeMetric.samples) / w,
+        )
+        .where(NodeMetric.node_id == node_id, NodeMetric.ts >= since)
+        .group_by(NodeMetric.ts)
+        .order_by(NodeMetric.ts)
+    ).all()
+    return [
+        {"ts": ts, "samples": n, "cpu_avg": cpu, "cpu_max": cpu_max, "mem_avg": mem,
+         "rx_bps": rx, "tx_bps": tx}
+        for ts, n, cpu, cpu_max, mem, rx, tx in rows
+    ]
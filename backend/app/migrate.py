@@ -0,0 +1,105 @@
+# app/migrate.py
+"""
+Columnas e índices agregados a tablas que ya existían en despliegues anteriores.
+create_all sólo crea tablas nuevas (nunca altera las existentes): upgrade_schema()
+agrega lo que falte con ALTER TABLE ... ADD COLUMN y crea los índices faltantes.
+Es idempotente; corre al arrancar después de create_all o a mano:
+
+    python -m app.migrate
+"""
+from sqlalchemy import inspect, text
+
+from .db import engine
+from .models import Base
+
+# (tabla, columna, DEFAULT para filas existentes o None => columna nullable),
+# en el orden en que las fue necesitando cada cambio
+_ADD_COLUMNS = (
+    # uploads reanudables: /complete idempotente
+    ("upload_sessions", "media_id", None),
+    # blobs direccionados por contenido
+    ("media_files", "storage_path", None),
+    # progreso de FFmpeg
+    ("jobs", "speed", None),
+    ("jobs", "eta_sec", None),
+    # leases, reintentos y backoff
+    ("jobs", "lease_expires_at", None),
+    ("jobs", "attempts", "0"),
+    ("jobs", "not_before", None),
+    # slots por nodo
+    ("nodes", "slots", "1"),
+    # prioridad y fair-share
+    ("jobs", "owner_id", "0"),
+    ("jobs", "priority", "0"),
+    # localidad de datos y transfer
+    ("jobs", "home_node", None),
+    ("jobs", "locality_until", None),
+    ("jobs", "pinned", "FALSE"),
+    # costo estimado y throughput aprendido
+    ("jobs", "cost", "1.0"),
+    ("nodes", "throughput", "1.0"),
+    # concurrencia AIMD
+    ("nodes", "cpu_avg", None),
+    ("nodes", "conc_limit", "1.0"),
+    ("nodes", "conc_ssthresh", None),
+    ("nodes", "conc_ref_rate", None),
+    ("nodes", "conc_changed_at", None),
+    # búsqueda
+    ("media_meta", "tags", None),
+)
+
+# FKs cuyo ON DELETE cambió (sólo Postgres: SQLite no altera constraints)
+_FK_ON_DELETE = (
+    ("upload_sessions", "media_id", "media_files", "SET NULL"),
+)
+
+def _fix_fk_on_delete(conn, insp, tables: set[str], done: list[str]):
+    if engine.dialect.name != "postgresql":
+        return
+    for table, column, target, action in _FK_ON_DELETE:
+        if table not in tables:
+            continue
+        for fk in insp.get_foreign_keys(table):
+            if fk["constrained_columns"] != [column] or fk["referred_table"] != target:
+                continue
+            if (fk.get("options") or {}).get("ondelete", "").upper() == action:
+                continue
+            name = fk["name"]
+            conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT {name}"))
+            ddl = (f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) "
+                   f"REFERENCES {target}(id) ON DELETE {action}")
+            conn.execute(text(ddl))
+            done.append(ddl)
+
+def upgrade_schema() -> list[str]:
+    """Aplica lo que falte; devuelve las sentencias ejecutadas."""
+    insp = inspect(engine)
+    tables = set(insp.get_table_names())
+    done = []
+    with engine.begin() as conn:
+        for table, name, default in _ADD_COLUMNS:
+            if table not in tables:
+                continue  # la crea create_all completa
+            if name in {c["name"] for c in insp.get_columns(table)}:
+                continue
+            col = Base.metadata.tables[table].c[name]
+            ddl = f"ALTER TABLE {table} ADD COLUMN {name} {col.type.compile(dialect=engine.dialect)}"
+            if default is not None:
+                ddl += f" NOT NULL DEFAULT {default}"
+            conn.execute(text(ddl))
+            done.append(ddl)
+        _fix_fk_on_delete(conn, insp, tables, done)
+        # índices nuevos sobre tablas viejas (ix_jobs_queue_owner, ix_media_*_created_id, ...)
+        for table in Base.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            existing = {ix["name"] for ix in insp.get_indexes(table.name)}
+            for ix in table.indexes:
+                if ix.name not in existing:
+                    ix.create(bind=conn, checkfirst=True)
+                    done.append(f"CREATE INDEX {ix.name}")
+    return done
+
+if __name__ == "__main__":
+    for stmt in upgrade_schema() or ["(sin cambios)"]:
+        print(stmt)
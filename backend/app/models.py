@@ -4,7 +4,7 @@ from uuid import uuid4
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy import (
     String, Boolean, Integer, ForeignKey, DateTime, Table, Text, UniqueConstraint,
-    Column, BigInteger, JSON
+    Column, BigInteger, JSON, Index
 )
 
 
@@ -42,6 +42,8 @@ class Role(Base):
 
 class Session(Base):
     __tablename__ = "sessions"
+    # keyset de /monitor/sessions: ORDER BY created_at DESC, id DESC
+    __table_args__ = (Index("ix_sessions_created_id", "created_at", "id"),)
     id: Mapped[str] = mapped_column(String(36), primary_key=True)  # UUID str
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -62,6 +64,11 @@ class Session(Base):
     
 class MediaFile(Base):
     __tablename__ = "media_files"
+    # keyset de GET /media: (created_at, id) por dueño y global (admin)
+    __table_args__ = (
+        Index("ix_media_owner_created_id", "owner_id", "created_at", "id"),
+        Index("ix_media_created_id", "created_at", "id"),
+    )
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
 
     owner_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True, nullable=False)
@@ -69,12 +76,86 @@ class MediaFile(Base):
     rel_path: Mapped[str] = mapped_column(Text, nullable=False)
     mime: Mapped[str | None] = mapped_column(String(128))
     size_bytes: Mapped[int | None] = mapped_column(BigInteger)
-    sha256: Mapped[str | None] = mapped_column(String(64))  # hex de 64 chars
+    sha256: Mapped[str | None] = mapped_column(String(64), index=True)  # hex de 64 chars
+    # ruta real en disco (blob direccionado por contenido); None => archivo legado en rel_path
+    storage_path: Mapped[str | None] = mapped_column(Text)
     node_home: Mapped[str] = mapped_column(String(128), default="worker-1")
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     owner: Mapped["User"] = relationship("User")
+    # borrar el media borra su fila de media_meta (media_id es la PK: no se puede dejar en NULL)
+    meta: Mapped["MediaMeta | None"] = relationship(
+        "MediaMeta", uselist=False, lazy="selectin", cascade="all, delete-orphan"
+    )
+
+# --- Metadatos de ffprobe (job 'reindex') ---
+class MediaMeta(Base):
+    __tablename__ = "media_meta"
+    media_id: Mapped[int] = mapped_column(ForeignKey("media_files.id"), primary_key=True)
+    duration_sec: Mapped[float | None] = mapped_column()
+    format_name: Mapped[str | None] = mapped_column(String(64))
+    bit_rate: Mapped[int | None] = mapped_column(BigInteger)
+    video_codec: Mapped[str | None] = mapped_column(String(32))
+    audio_codec: Mapped[str | None] = mapped_column(String(32))
+    width: Mapped[int | None] = mapped_column(Integer)
+    height: Mapped[int | None] = mapped_column(Integer)
+    sample_rate: Mapped[int | None] = mapped_column(Integer)
+    channels: Mapped[int | None] = mapped_column(Integer)
+    tags: Mapped[str | None] = mapped_column(Text)   # título/artista/... para la búsqueda
+    probed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+# --- Copias de un media en otros nodos (job 'transfer') ---
+class MediaReplica(Base):
+    __tablename__ = "media_replicas"
+    __table_args__ = (UniqueConstraint("media_id", "node_name", name="uq_media_replica"),)
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    media_id: Mapped[int] = mapped_column(ForeignKey("media_files.id"), index=True, nullable=False)
+    node_name: Mapped[str] = mapped_column(String(128), index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+# --- Blobs direccionados por contenido ---
+class Blob(Base):
+    __tablename__ = "blobs"
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # ruta relativa respecto a MEDIA_ROOT (ej: "blobs/ab/cd/abcd...")
+    rel_path: Mapped[str] = mapped_column(Text, nullable=False)
+    size_bytes: Mapped[int] = mapped_column(BigInteger)
+    mime: Mapped[str | None] = mapped_column(String(128))
+    refcount: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+# --- Uploads por partes (reanudables) ---
+# status: open | done | aborted
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+    id: Mapped[str] = mapped_column(String(36), primary_key=True)  # UUID str
+    owner_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True, nullable=False)
+    filename: Mapped[str] = mapped_column(String(255))
+    total_size: Mapped[int] = mapped_column(BigInteger)
+    part_size: Mapped[int] = mapped_column(BigInteger)
+    status: Mapped[str] = mapped_column(String(16), index=True, default="open")
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+    # media creado al completar: un /complete repetido lo devuelve en vez de fallar
+    media_id: Mapped[int | None] = mapped_column(ForeignKey("media_files.id", ondelete="SET NULL"))
+
+    parts: Mapped[list["UploadPart"]] = relationship("UploadPart", back_populates="session")
+
+    @property
+    def part_count(self) -> int:
+        return max(1, (self.total_size + self.part_size - 1) // self.part_size)
+
+class UploadPart(Base):
+    __tablename__ = "upload_parts"
+    __table_args__ = (UniqueConstraint("session_id", "part_no", name="uq_upload_part"),)
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    session_id: Mapped[str] = mapped_column(ForeignKey("upload_sessions.id"), index=True)
+    part_no: Mapped[int] = mapped_column(Integer)  # 0..part_count-1
+    size_bytes: Mapped[int] = mapped_column(BigInteger)
+    received_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    session: Mapped[UploadSession] = relationship("UploadSession", back_populates="parts")
 
 class Share(Base):
     __tablename__ = "shares"
@@ -109,23 +190,65 @@ class Node(Base):
     mem_pct: Mapped[float | None] = mapped_column()
     net_in: Mapped[int | None] = mapped_column(BigInteger)
     net_out: Mapped[int | None] = mapped_column(BigInteger)
+    slots: Mapped[int] = mapped_column(Integer, default=1)  # capacidad anunciada por el worker
+    throughput: Mapped[float] = mapped_column(default=1.0)  # EWMA costo/segundo real (scheduler)
+    # control AIMD de concurrencia (app/concurrency.py)
+    cpu_avg: Mapped[float | None] = mapped_column()
+    conc_limit: Mapped[float] = mapped_column(default=1.0)
+    conc_ssthresh: Mapped[float | None] = mapped_column()
+    conc_ref_rate: Mapped[float | None] = mapped_column()
+    conc_changed_at: Mapped[datetime | None] = mapped_column(DateTime)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
 
+# --- Telemetría de nodos: un punto por minuto (app/metrics.py) ---
+class NodeMetric(Base):
+    __tablename__ = "node_metrics"
+    __table_args__ = (Index("ix_node_metrics_node_ts", "node_id", "ts"),)
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    node_id: Mapped[int] = mapped_column(ForeignKey("nodes.id"), nullable=False)
+    ts: Mapped[datetime] = mapped_column(DateTime, index=True)  # inicio del minuto
+    samples: Mapped[int] = mapped_column(Integer, default=0)
+    cpu_avg: Mapped[float | None] = mapped_column()
+    cpu_max: Mapped[float | None] = mapped_column()
+    mem_avg: Mapped[float | None] = mapped_column()
+    rx_bps: Mapped[float | None] = mapped_column()
+    tx_bps: Mapped[float | None] = mapped_column()
+
 # --- Jobs ---
 # status: queued | running | done | failed | canceled
-# type  : convert | transfer | reindex
+# type  : convert | package | transfer | reindex
+#   transfer: {"media_id": 1, "target_node": "worker-2", "move": false}
+#   reindex : {"owner_id": 1 | null (toda la biblioteca), "only_missing": true}
+# priority: mayor = antes (interactivo 10, normal 0, lote -10)
 class Job(Base):
     __tablename__ = "jobs"
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     type: Mapped[str] = mapped_column(String(16), index=True)
-    payload: Mapped[dict] = mapped_column(JSON)  # ej: {"media_id": 1, "target_ext": ".mp3"}
+    payload: Mapped[dict] = mapped_column(JSON)  # ej: {"media_id": 1, "target_ext": ".mp3"} | package: {"media_id": 1}
     status: Mapped[str] = mapped_column(String(16), index=True, default="queued")
     assigned_node_id: Mapped[int | None] = mapped_column(ForeignKey("nodes.id"))
     progress: Mapped[float] = mapped_column(default=0.0)
+    speed: Mapped[float | None] = mapped_column()    # x tiempo real (FFmpeg -progress)
+    eta_sec: Mapped[float | None] = mapped_column()
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     started_at: Mapped[datetime | None] = mapped_column(DateTime)
     finished_at: Mapped[datetime | None] = mapped_column(DateTime)
     error: Mapped[str | None] = mapped_column(Text)
+    # lease: el nodo asignado lo renueva con progress/heartbeat; vencido => el reaper lo re-encola
+    lease_expires_at: Mapped[datetime | None] = mapped_column(DateTime, index=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    not_before: Mapped[datetime | None] = mapped_column(DateTime)  # backoff tras un lease vencido
+    # fair-share: dueño del media del payload (o quien creó el job); 0 = sin dueño
+    owner_id: Mapped[int] = mapped_column(Integer, default=0)
+    priority: Mapped[int] = mapped_column(Integer, default=0)
+    # localidad: nodo con el media fuente; otro nodo sólo lo toma pasado locality_until
+    home_node: Mapped[str | None] = mapped_column(String(128))
+    locality_until: Mapped[datetime | None] = mapped_column(DateTime)
+    pinned: Mapped[bool] = mapped_column(Boolean, default=False)  # sólo home_node puede tomarlo (transfer)
+    cost: Mapped[float] = mapped_column(default=1.0)  # segundos estimados en un nodo de referencia
+
+# cola: cabeza de cada dueño por (prioridad, antigüedad) y conteo de 'running' por dueño
+Index("ix_jobs_queue_owner", Job.status, Job.owner_id, Job.priority.desc(), Job.created_at)
 
 # --- Job locks (opcional, útil para auditoría) ---
 class JobLock(Base):
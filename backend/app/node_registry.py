@@ -0,0 +1,180 @@
+# app/node_registry.py
+"""
+Estado de los nodos en memoria para no consultar la tabla nodes en cada next_job.
+- heartbeat/register/done actualizan NODES y marcan el nodo como sucio; el heartbeat
+  no escribe en la DB: también difiere la renovación de leases y la telemetría (METRICS).
+- Un hilo de fondo cada NODE_FLUSH_SEC: persiste los sucios en un solo UPDATE por lotes,
+  renueva los leases acumulados, inserta los minutos de telemetría cerrados,
+  recarga la tabla (otros procesos/réplicas del coordinador reciben otros heartbeats)
+  y re-encola los jobs 'queued' asignados a nodos en freno duro (antes se hacía en cada poll).
+- NodeState tiene los mismos atributos que Node: concurrency/scheduler reciben cualquiera.
+"""
+import threading
+from dataclasses import dataclass, fields
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .db import SessionLocal
+from .models import Node, Job
+from .concurrency import is_critical
+from .leases import extend_leases_bulk
+from .metrics import METRICS
+
+STALE_SEC = 10
+
+@dataclass
+class NodeState:
+    id: int
+    name: str
+    api_url: str | None = None
+    last_seen: datetime | None = None
+    cpu_pct: float | None = None
+    mem_pct: float | None = None
+    net_in: int | None = None
+    net_out: int | None = None
+    slots: int = 1
+    throughput: float = 1.0
+    cpu_avg: float | None = None
+    conc_limit: float = 1.0
+    conc_ssthresh: float | None = None
+    conc_ref_rate: float | None = None
+    conc_changed_at: datetime | None = None
+    is_active: bool = True
+
+    @classmethod
+    def from_row(cls, n: Node) -> "NodeState":
+        return cls(**{f.name: getattr(n, f.name) for f in fields(cls)})
+
+# columnas que escribe el coordinador en memoria (no api_url/is_active: se editan en la DB)
+_PERSISTED = (
+    "last_seen", "cpu_pct", "mem_pct", "net_in", "net_out", "slots", "throughput",
+    "cpu_avg", "conc_limit", "conc_ssthresh", "conc_ref_rate", "conc_changed_at",
+)
+
+class NodeRegistry:
+    def __init__(self):
+        self._nodes: dict[str, NodeState] = {}
+        self._dirty: set[str] = set()
+        self._leases: dict[int, list[int] | None] = {}
+        self._lock = threading.Lock()
+
+    # --- lectura ---
+    def get(self, db: Session, name: str) -> NodeState | None:
+        """Desde memoria; si falta (registrado en otro proceso) se carga de la DB."""
+        with self._lock:
+            st = self._nodes.get(name)
+        if st is not None:
+            return st
+        row = db.scalar(select(Node).where(Node.name == name))
+        return self.put(row) if row else None
+
+    def by_id(self, node_id: int) -> NodeState | None:
+        with self._lock:
+            return next((n for n in self._nodes.values() if n.id == node_id), None)
+
+    def actives(self, now: datetime | None = None) -> list[NodeState]:
+        cutoff = (now or datetime.utcnow()) - timedelta(seconds=STALE_SEC)
+        with self._lock:
+            return [
+                n for n in self._nodes.values()
+                if n.is_active and (n.last_seen is None or n.last_seen >= cutoff)
+            ]
+
+    # --- escritura ---
+    def put(self, row: Node) -> NodeState:
+        st = NodeState.from_row(row)
+        with self._lock:
+            self._nodes[st.name] = st
+            self._dirty.discard(st.name)
+        return st
+
+    def touch(self, st: NodeState):
+        """Marca el nodo para el próximo flush."""
+        with self._lock:
+            self._dirty.add(st.name)
+
+    def defer_leases(self, node_id: int, job_ids: list[int] | None):
+        """Leases a renovar en el próximo flush (el último heartbeat del nodo manda)."""
+        with self._lock:
+            self._leases[node_id] = list(job_ids) if job_ids is not None else None
+
+    # --- persistencia ---
+    def flush(self, db: Session) -> int:
+        with self._lock:
+            dirty = [self._nodes[name] for name in self._dirty if name in self._nodes]
+            self._dirty.clear()
+            rows = [{"id": n.id, **{k: getattr(n, k) for k in _PERSISTED}} for n in dirty]
+            leases, self._leases = self._leases, {}
+        if rows:
+            db.execute(update(Node), rows)  # UPDATE por lotes por PK
+        if leases:
+            extend_leases_bulk(db, leases)
+        if rows or leases:
+            db.commit()
+        return len(rows)
+
+    def reload(self, db: Session):
+        """Trae cambios de otros procesos sin pisar lo que este aún no persistió."""
+        rows = db.scalars(select(Node)).all()
+        with self._lock:
+            seen = set()
+            for r in rows:
+                seen.add(r.name)
+                cur = self._nodes.get(r.name)
+                if r.name in self._dirty and cur is not None:
+                    cur.api_url, cur.is_active = r.api_url, r.is_active
+                    continue
+                if cur is None or cur.last_seen is None or (r.last_seen and r.last_seen >= cur.last_seen):
+                    self._nodes[r.name] = NodeState.from_row(r)
+                else:
+                    cur.api_url, cur.is_active = r.api_url, r.is_active
+            for name in set(self._nodes) - seen:
+                self._nodes.pop(name, None)
+
+NODES = NodeRegistry()
+
+def requeue_from_critical(db: Session) -> int:
+    """Jobs 'queued' pre-asignados a nodos en freno duro vuelven a la cola general."""
+    ids = [n.id for n in NODES.actives() if is_critical(n)]
+    if not ids:
+        return 0
+    res = db.execute(
+        update(Job).where(Job.status == "queued", Job.assigned_node_id.in_(ids)).values(assigned_node_id=None)
+    )
+    db.commit()
+    return res.rowcount or 0
+
+# === Hilo de fondo ===
+
+_flusher: threading.Thread | None = None
+
+def _flush_loop():
+    stop = threading.Event()
+    while not stop.wait(max(0.5, settings.node_flush_sec)):
+        db = SessionLocal()
+        try:
+            NODES.flush(db)
+            METRICS.flush(db)
+            NODES.reload(db)
+            requeue_from_critical(db)
+        except Exception as e:
+            db.rollback()
+            print("[nodes] flush error:", e)
+        finally:
+            db.close()
+
+def start_node_registry():
+    """Carga inicial y arranque del flusher (uno por proceso)."""
+    global _flusher
+    if _flusher is not None:
+        return
+    db = SessionLocal()
+    try:
+        NODES.reload(db)
+    finally:
+        db.close()
+    _flusher = threading.Thread(target=_flush_loop, name="node-flush", daemon=True)
+    _flusher.start()
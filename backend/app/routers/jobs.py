@@ -1,17 +1,95 @@
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timedelta
+from pathlib import Path
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 from ..auth import get_db, require_roles, require_user
-from ..models import Job
+from ..config import settings
+from ..models import Job, MediaFile, Node
 from ..schemas import JobCreateIn, JobOut
+from ..streaming import serve_file
+from ..dispatch import announce_jobs, notify_local
+from ..scheduler import estimate_cost
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
+PRIORITY_INTERACTIVE = 10
+PRIORITY_NORMAL = 0
+PRIORITY_BULK = -10
+MAX_LOG_TAIL = 4 * 1024 * 1024    # tail se lee a memoria; el log completo va por tail=0 (streaming)
+
+def _is_admin(u) -> bool:
+    return any(r.name == "admin" for r in u.roles)
+
+def job_priority(requested: int, u) -> int:
+    """
+    La prioridad ordena antes que el turno de fair-share: un usuario normal queda entre
+    PRIORITY_BULK e PRIORITY_INTERACTIVE para no pasar por delante de los demás;
+    sólo un admin usa el rango completo.
+    """
+    if _is_admin(u):
+        return requested
+    return max(PRIORITY_BULK, min(PRIORITY_INTERACTIVE, requested))
+
+def payload_media(db: Session, payload: dict) -> MediaFile | None:
+    mid = payload.get("media_id") if isinstance(payload, dict) else None
+    if mid is None:
+        return None
+    try:
+        return db.get(MediaFile, int(mid))
+    except (TypeError, ValueError):
+        return None
+
+def job_log_path(jid: int) -> Path:
+    """Log completo de FFmpeg del job (lo escribe el worker; storage compartido como MEDIA_ROOT)."""
+    base = Path(settings.job_log_dir) if settings.job_log_dir else Path(settings.media_root) / "logs" / "jobs"
+    return base.resolve() / f"{jid}.log"
+
 @router.post("", response_model=JobOut)
 def create_job(data: JobCreateIn, db: Session = Depends(get_db), user=Depends(require_user)):
-    j = Job(type=data.type, payload=data.payload, status="queued", progress=0.0)
-    db.add(j); db.commit(); db.refresh(j)
+    u, _, _ = user
+    media = payload_media(db, data.payload)
+    if data.type == "transfer":
+        return _create_transfer_job(db, data, media, u)
+    if data.type == "reindex" and not _is_admin(u):
+        # sólo un admin reindexa la biblioteca completa o la de otro usuario
+        data.payload["owner_id"] = u.id
+    j = Job(
+        type=data.type, payload=data.payload, status="queued", progress=0.0,
+        priority=job_priority(data.priority, u),
+        # fair-share: dueño del media (o quien crea el job)
+        owner_id=media.owner_id if media else u.id,
+        # localidad: preferir el nodo que ya tiene el archivo
+        home_node=media.node_home if media else None,
+        locality_until=datetime.utcnow() + timedelta(seconds=settings.locality_wait_sec) if media else None,
+        cost=estimate_cost(db, data.type, data.payload, media),
+    )
+    db.add(j)
+    announce_jobs(db)  # despierta a los workers en long-poll
+    db.commit(); db.refresh(j)
+    notify_local()
+    return j
+
+def _create_transfer_job(db: Session, data: JobCreateIn, media: MediaFile | None, u) -> Job:
+    """transfer corre en el nodo destino: se fija a target_node (pinned)."""
+    if not media:
+        raise HTTPException(400, "transfer requiere un media_id válido")
+    if media.owner_id != u.id and not _is_admin(u):
+        # move=true además cambia node_home del media
+        raise HTTPException(403, "Solo el propietario o admin puede transferir el media")
+    target = (data.payload.get("target_node") or "").strip()
+    if not target or not db.scalar(select(Node.id).where(Node.name == target)):
+        raise HTTPException(400, "transfer requiere un target_node registrado")
+    j = Job(
+        type="transfer", payload=data.payload, status="queued", progress=0.0,
+        priority=job_priority(data.priority, u), owner_id=media.owner_id,
+        home_node=target, pinned=True, cost=estimate_cost(db, "transfer", data.payload, media),
+    )
+    db.add(j)
+    announce_jobs(db)
+    db.commit(); db.refresh(j)
+    notify_local()
     return j
 
 @router.get("/{jid}", response_model=JobOut)
@@ -20,3 +98,29 @@ def get_job(jid: int, db: Session = Depends(get_db), user=Depends(require_user))
     if not j:
         raise HTTPException(404, "Job no encontrado")
     return j
+
+@router.get("/{jid}/log")
+def get_job_log(
+    jid: int,
+    request: Request,
+    tail: int = Query(65536, ge=0, le=MAX_LOG_TAIL, description="Últimos N bytes; 0 => archivo completo (soporta Range)"),
+    db: Session = Depends(get_db),
+    user=Depends(require_user),
+):
+    u, _, _ = user
+    j = db.scalar(select(Job).where(Job.id == jid))
+    if not j:
+        raise HTTPException(404, "Job no encontrado")
+    # el log trae rutas de almacenamiento: sólo el dueño del job o un admin
+    if j.owner_id != u.id and not _is_admin(u):
+        raise HTTPException(403, "Solo el propietario o admin puede ver el log")
+    path = job_log_path(jid)
+    if not path.is_file():
+        raise HTTPException(404, "Log no disponible")
+    if tail == 0:
+        return serve_file(request, path, "text/plain; charset=utf-8")
+    size = path.stat().st_size
+    with open(path, "rb") as f:
+        f.seek(max(0, size - tail))
+        data = f.read(tail)
+    return PlainTextResponse(data.decode("utf-8", "ignore"))
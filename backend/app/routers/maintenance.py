@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import select
 from ..auth import get_db, require_roles
 from ..models import Job, Node
+from ..leases import reap_expired_leases
 
 router = APIRouter(prefix="/maintenance", tags=["maintenance"])
 
@@ -27,3 +28,8 @@ def rebalance_queued(db: Session = Depends(get_db), admin=Depends(require_roles(
         j.assigned_node_id = None
     db.commit()
     return {"requeued": len(jobs)}
+
+@router.post("/reap-leases")
+def reap_leases(db: Session = Depends(get_db), admin=Depends(require_roles(["admin"]))):
+    """Corre el reaper a mano (también corre solo cada REAPER_EVERY_SEC)."""
+    return reap_expired_leases(db)
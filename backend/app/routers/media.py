@@ -1,10 +1,14 @@
 import os
-import io
+import time
+import shutil
+import hmac
+import secrets
 import hashlib
+import threading
 import mimetypes
+import tempfile
 from pathlib import Path
 from datetime import datetime, timedelta
-from starlette.responses import StreamingResponse
 from typing import Optional, List
 
 try:
@@ -13,13 +17,19 @@ try:
 except Exception:
     HAS_MAGIC = False
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request, Response, status, Query
+import jwt  # PyJWT
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request, Response, Query
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from sqlalchemy import select, tuple_, func
 
 from ..auth import require_user, require_roles, get_db
 from ..config import settings
-from ..models import MediaFile, Share
-from ..schemas import MediaOut, ShareIn, ShareOut
+from ..models import MediaFile, Share, Blob, MediaReplica, UploadSession
+from ..schemas import MediaOut, MediaSearchOut, MediaByHashIn, BlobChallengeIn, BlobChallengeOut, ShareIn, ShareOut
+from ..blobstore import store_blob, find_blob, acquire_blob, release_blob, discard_file, blob_abs_path
+from ..streaming import serve_file
+from ..search import rank_media, SEARCH_INDEX
 
 router = APIRouter(prefix="/media", tags=["media"])
 
@@ -53,14 +63,140 @@ def sha256_bytes(content_bytes: bytes) -> str:
 def media_abs_path(rel_path: str) -> Path:
     return Path(settings.media_root).resolve() / rel_path
 
+UPLOAD_CHUNK = 1024 * 1024  # 1 MiB por lectura del cuerpo
+SNIFF_BYTES = 8192
+
+# prueba de posesión para /media/by-hash: el cliente hashea un rango elegido por el servidor
+PROOF_TOKEN_AUD = "blob-proof"
+PROOF_TTL_SEC = 300
+PROOF_RANGE = 64 * 1024
+
+def media_tmp_dir() -> Path:
+    # dentro de MEDIA_ROOT para que el rename final sea atómico (mismo filesystem)
+    d = Path(settings.media_root).resolve() / ".tmp"
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+def _write_chunk(fh, h, data: bytes):
+    fh.write(data)
+    h.update(data)
+
+async def save_upload_stream(file: UploadFile, filename: str) -> tuple[Path, str, str, int]:
+    """
+    Copia el UploadFile a disco por bloques de UPLOAD_CHUNK.
+    Calcula sha256 y tamaño en la misma pasada y detecta MIME con el primer bloque.
+    Escribe en un temporal de MEDIA_ROOT/.tmp; el llamador lo mueve al blobstore.
+    Devuelve (tmp_path, sha256, mime, size). Memoria constante sin importar el tamaño.
+    """
+    fd, tmp_name = tempfile.mkstemp(prefix="up_", suffix=".part", dir=media_tmp_dir())
+    h = hashlib.sha256()
+    size = 0
+    head = b""
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                data = await file.read(UPLOAD_CHUNK)
+                if not data:
+                    break
+                if len(head) < SNIFF_BYTES:
+                    head += data[:SNIFF_BYTES - len(head)]
+                size += len(data)
+                await run_in_threadpool(_write_chunk, out, h, data)
+        if size == 0:
+            raise HTTPException(400, "Archivo vacío")
+    except BaseException:
+        discard_file(Path(tmp_name))
+        raise
+    return Path(tmp_name), h.hexdigest(), guess_mime(head, filename), size
+
+def media_storage_path(media: MediaFile) -> Path:
+    """Ruta real del contenido: el blob si existe, si no el archivo legado en rel_path."""
+    return media_abs_path(media.storage_path or media.rel_path)
+
+def hls_dir(media_id: int) -> Path:
+    """Paquete HLS del media (job 'package'): master.m3u8 + <rendición>/index.m3u8 + segmentos."""
+    return Path(settings.media_root).resolve() / "hls" / str(media_id)
+
+def media_etag(media: MediaFile) -> str | None:
+    """sha256 como ETag fuerte sólo para blobs (inmutables); legados usan mtime/tamaño."""
+    return media.sha256 if media.storage_path else None
+
+def media_out(media: MediaFile) -> MediaOut:
+    return MediaOut(
+        id=media.id,
+        owner_id=media.owner_id,
+        rel_path=media.rel_path,
+        mime=media.mime,
+        size_bytes=media.size_bytes,
+        sha256=media.sha256,
+        node_home=media.node_home,
+        created_at=media.created_at,
+        duration_sec=media.meta.duration_sec if media.meta else None,
+    )
+
+def new_media_from_blob(owner_id: int, rel_path: str, blob: Blob) -> MediaFile:
+    return MediaFile(
+        owner_id=owner_id,
+        rel_path=rel_path,
+        storage_path=blob.rel_path,
+        mime=blob.mime,
+        size_bytes=blob.size_bytes,
+        sha256=blob.sha256,
+        node_home=settings.node_name,
+    )
+
+def user_rel_path(user_id: int, filename: str) -> str:
+    # ruta lógica (nombre visible); el contenido vive en el blob
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    return f"u_{user_id}/{today}/{filename}"
+
 # === Endpoints ===
 
+# total aproximado: COUNT cacheado por filtro (dueño, búsqueda) durante COUNT_TTL_SEC
+COUNT_TTL_SEC = 30.0
+_count_cache: dict[tuple, tuple[float, int]] = {}
+_count_lock = threading.Lock()
+
+def _cached_count(query, key: tuple) -> int:
+    now = time.monotonic()
+    with _count_lock:
+        hit = _count_cache.get(key)
+    if hit and now - hit[0] < COUNT_TTL_SEC:
+        return hit[1]
+    total = query.order_by(None).count()
+    with _count_lock:
+        _count_cache[key] = (now, total)
+    return total
+
+def invalidate_media_count(owner_id: int | None = None):
+    """Descarta los totales cacheados del dueño (y los globales de admin)."""
+    with _count_lock:
+        for key in [k for k in _count_cache if k[0] in (owner_id, None)]:
+            _count_cache.pop(key, None)
+
+def _owner_scope(user, owner_id: Optional[int]) -> Optional[int]:
+    """Dueño a filtrar: el propio para usuarios normales; admin ve todo u owner_id."""
+    if not any(r.name == "admin" for r in user.roles):
+        return user.id
+    return owner_id
+
+def _encode_cursor(created_at: datetime, mid: int) -> str:
+    return f"{created_at.isoformat()}|{mid}"
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        ts, mid = cursor.split("|", 1)
+        return datetime.fromisoformat(ts), int(mid)
+    except ValueError:
+        raise HTTPException(400, "Cursor inválido")
+
 @router.get("", response_model=dict)
 def list_media(
     q: Optional[str] = Query(None, description="Buscar por nombre (rel_path)"),
     owner_id: Optional[int] = Query(None, description="Filtrar por dueño (solo admin)"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior (keyset)"),
     ctx=Depends(require_user),
     db: Session = Depends(get_db),
 ):
@@ -68,56 +204,63 @@ def list_media(
     Lista de medios con paginación.
     - Usuarios normales: sólo sus archivos.
     - Admin: puede ver todos o filtrar por owner_id.
+    - Keyset por (created_at, id) con `cursor`: O(página) a cualquier profundidad.
+      `page` sin cursor se mantiene (OFFSET) por compatibilidad.
+    - total es aproximado: se cachea COUNT_TTL_SEC segundos.
     """
     user, _, _ = ctx
-    is_admin = any(r.name == "admin" for r in user.roles)
-
     query = db.query(MediaFile)
 
     # permisos
-    if not is_admin:
-        query = query.filter(MediaFile.owner_id == user.id)
-    else:
-        if owner_id is not None:
-            query = query.filter(MediaFile.owner_id == owner_id)
+    scope = _owner_scope(user, owner_id)
+    if scope is not None:
+        query = query.filter(MediaFile.owner_id == scope)
 
-    # búsqueda simple por ruta/nombre
+    # búsqueda simple por ruta/nombre (lower() LIKE: usa el índice de trigramas en Postgres)
     if q:
-        like = f"%{q}%"
-        query = query.filter(MediaFile.rel_path.ilike(like))
-
-    # total para paginación
-    total = query.count()
-
-    # orden y paginado
-    query = query.order_by(MediaFile.created_at.desc()) \
-                 .offset((page - 1) * page_size) \
-                 .limit(page_size)
-
-    rows = query.all()
-
-    items: List[MediaOut] = [
-        MediaOut(
-            id=m.id,
-            owner_id=m.owner_id,
-            rel_path=m.rel_path,
-            mime=m.mime,
-            size_bytes=m.size_bytes,
-            sha256=m.sha256,
-            node_home=m.node_home,
-            created_at=m.created_at,
-        )
-        for m in rows
-    ]
+        like = f"%{q.lower()}%"
+        query = query.filter(func.lower(MediaFile.rel_path).like(like))
+
+    # total para paginación (aproximado)
+    total = _cached_count(query, (scope, q or ""))
+
+    # orden y paginado: (created_at, id) sobre ix_media_owner_created_id / ix_media_created_id
+    query = query.order_by(MediaFile.created_at.desc(), MediaFile.id.desc())
+    if cursor:
+        c_ts, c_id = _decode_cursor(cursor)
+        query = query.filter(tuple_(MediaFile.created_at, MediaFile.id) < tuple_(c_ts, c_id))
+    elif page > 1:
+        query = query.offset((page - 1) * page_size)
+
+    rows = query.limit(page_size + 1).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    items: List[MediaOut] = [media_out(m) for m in rows]
 
     return {
         "items": items,
         "total": total,
+        "total_approx": True,
         "page": page,
         "page_size": page_size,
         "pages": (total + page_size - 1) // page_size if total else 0,
+        "next_cursor": _encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None,
     }
 
+@router.get("/search", response_model=List[MediaSearchOut])
+def search_media(
+    q: str = Query(..., min_length=1, max_length=200, description="Texto a buscar en nombre y etiquetas"),
+    owner_id: Optional[int] = Query(None, description="Filtrar por dueño (solo admin)"),
+    limit: int = Query(20, ge=1, le=100),
+    ctx=Depends(require_user),
+    db: Session = Depends(get_db),
+):
+    """Búsqueda por relevancia (trigramas) sobre rel_path y etiquetas de ffprobe."""
+    user, _, _ = ctx
+    ranked = rank_media(db, q, _owner_scope(user, owner_id), limit)
+    return [MediaSearchOut(**media_out(m).model_dump(), score=round(score, 3)) for m, score in ranked]
+
 @router.post("/upload", response_model=MediaOut, status_code=201)
 async def upload_media(
     file: UploadFile = File(...),
@@ -126,90 +269,130 @@ async def upload_media(
 ):
     user, _, _ = ctx
 
-    raw = await file.read()
-    if not raw:
-        raise HTTPException(400, "Archivo vacío")
-
     safe_name = sanitize_filename(file.filename or "upload.bin")
-    today = datetime.utcnow().strftime("%Y-%m-%d")
-    rel_path = f"u_{user.id}/{today}/{safe_name}"
-    abs_path = media_abs_path(rel_path)
-    ensure_dirs(abs_path)
-
-    # calcula hash/mime/size
-    digest = sha256_bytes(raw)
-    mime = guess_mime(raw[:8192], safe_name)
-    size = len(raw)
 
-    # guarda a disco
-    with open(abs_path, "wb") as f:
-        f.write(raw)
+    # stream a disco: hash/mime/size se calculan mientras se copia
+    tmp_path, digest, mime, size = await save_upload_stream(file, safe_name)
+    # si el contenido ya existe, se descarta el temporal y sólo se suma una referencia
+    blob = store_blob(db, tmp_path, digest, size, mime)
 
-    media = MediaFile(
-        owner_id=user.id,
-        rel_path=rel_path,
-        mime=mime,
-        size_bytes=size,
-        sha256=digest,
-        node_home=settings.node_name,
-    )
+    media = new_media_from_blob(user.id, user_rel_path(user.id, safe_name), blob)
     db.add(media)
     db.commit()
     db.refresh(media)
-    return MediaOut(
-        id=media.id,
-        owner_id=media.owner_id,
-        rel_path=media.rel_path,
-        mime=media.mime,
-        size_bytes=media.size_bytes,
-        sha256=media.sha256,
-        node_home=media.node_home,
-        created_at=media.created_at,
-    )
-
-CHUNK = 1024 * 1024
+    invalidate_media_count(user.id)
+    SEARCH_INDEX.add(media)
+    return media_out(media)
+
+def _user_has_blob(db: Session, user_id: int, sha256: str) -> bool:
+    return db.scalar(
+        select(MediaFile.id).where(MediaFile.owner_id == user_id, MediaFile.sha256 == sha256).limit(1)
+    ) is not None
+
+def _read_range(path: Path, offset: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
+def _check_proof(data: MediaByHashIn, user_id: int, blob) -> bool:
+    """Valida el challenge firmado y que proof corresponda al rango pedido del blob."""
+    if not data.challenge or not data.proof:
+        return False
+    try:
+        c = jwt.decode(data.challenge, settings.jwt_secret, algorithms=["HS256"], audience=PROOF_TOKEN_AUD)
+    except Exception:
+        return False
+    if c.get("uid") != user_id or c.get("sha") != blob.sha256 or c.get("size") != blob.size_bytes:
+        return False
+    try:
+        chunk = _read_range(blob_abs_path(blob.sha256), int(c["off"]), int(c["len"]))
+    except OSError:
+        return False
+    expected = hashlib.sha256(c["nonce"].encode() + chunk).hexdigest()
+    return hmac.compare_digest(expected, data.proof.lower())
+
+@router.get("/blobs/{sha256}")
+def blob_exists(sha256: str, ctx=Depends(require_user), db: Session = Depends(get_db)):
+    """Chequeo rápido "¿ya lo tengo?": sólo responde por blobs que el usuario ya referencia."""
+    user, _, _ = ctx
+    sha256 = sha256.lower()
+    blob = find_blob(db, sha256)
+    if not blob or not _user_has_blob(db, user.id, sha256):
+        raise HTTPException(404, "Contenido desconocido")
+    return {"sha256": blob.sha256, "size_bytes": blob.size_bytes, "mime": blob.mime}
+
+@router.post("/by-hash/challenge", response_model=BlobChallengeOut)
+def blob_challenge(data: BlobChallengeIn, ctx=Depends(require_user)):
+    """
+    Rango al azar que el cliente debe hashear (con el nonce) para probar que tiene el archivo.
+    Se emite para cualquier hash, exista o no: no revela qué contenidos hay en el servidor.
+    """
+    user, _, _ = ctx
+    if data.size <= 0:
+        raise HTTPException(400, "Tamaño inválido")
+    length = min(PROOF_RANGE, data.size)
+    offset = secrets.randbelow(data.size - length + 1)
+    nonce = secrets.token_hex(16)
+    token = jwt.encode({
+        "aud": PROOF_TOKEN_AUD,
+        "exp": int(time.time()) + PROOF_TTL_SEC,
+        "uid": user.id, "sha": data.sha256.lower(), "size": data.size,
+        "nonce": nonce, "off": offset, "len": length,
+    }, settings.jwt_secret, algorithm="HS256")
+    return BlobChallengeOut(challenge=token, nonce=nonce, offset=offset, length=length)
+
+@router.post("/by-hash", response_model=MediaOut, status_code=201)
+def create_media_by_hash(data: MediaByHashIn, ctx=Depends(require_user), db: Session = Depends(get_db)):
+    """
+    Registra un MediaFile sobre un blob existente sin volver a subir los bytes.
+    Si el usuario no referencia ya el blob, exige la prueba de posesión del challenge.
+    """
+    user, _, _ = ctx
+    sha256 = data.sha256.lower()
+    blob = find_blob(db, sha256)
+    if not blob or (data.size is not None and data.size != blob.size_bytes):
+        raise HTTPException(404, "Contenido desconocido")
+    # misma respuesta que "no existe": no confirma a terceros qué contenidos hay
+    if not _user_has_blob(db, user.id, sha256) and not _check_proof(data, user.id, blob):
+        raise HTTPException(404, "Contenido desconocido")
+    blob = acquire_blob(db, blob.sha256)
+    if not blob:
+        raise HTTPException(404, "Contenido desconocido")
+    safe_name = sanitize_filename(data.filename or "upload.bin")
+    media = new_media_from_blob(user.id, user_rel_path(user.id, safe_name), blob)
+    db.add(media)
+    db.commit()
+    db.refresh(media)
+    invalidate_media_count(user.id)
+    SEARCH_INDEX.add(media)
+    return media_out(media)
 
-def open_range(path: Path, range_hdr: str | None, mime: str | None) -> tuple[int,int,int,dict,io.BufferedReader]:
-    file_size = path.stat().st_size
-    start, end = 0, file_size - 1
-    if range_hdr:
-        try:
-            _, rng = range_hdr.split("=")
-            a, *b = rng.split("-")
-            start = int(a) if a else 0
-            if b and b[0]:
-                end = int(b[0])
-        except Exception:
-            # Range mal formado -> 416
-            raise HTTPException(status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, "Range inválido")
-
-    if start > end or start >= file_size:
-        raise HTTPException(status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, "Rango fuera de archivo")
-
-    length = end - start + 1
-    headers = {
-        "Content-Range": f"bytes {start}-{end}/{file_size}",
-        "Accept-Ranges": "bytes",
-        "Content-Length": str(length),
-        "Content-Type": mime or "application/octet-stream",
-    }
-    f = open(path, "rb")
-    f.seek(start)
-    return start, end, length, headers, f
+@router.delete("/{mid}")
+def delete_media(mid: int, ctx=Depends(require_user), db: Session = Depends(get_db)):
+    user, _, _ = ctx
+    media = db.query(MediaFile).filter(MediaFile.id == mid).first()
+    if not media:
+        raise HTTPException(404, "Media no encontrada")
+    if not can_view_media(user, media):
+        raise HTTPException(403, "Solo el propietario o admin puede borrar")
 
-def stream_iter(fh: io.BufferedReader, remaining: int):
-    try:
-        while remaining > 0:
-            data = fh.read(min(CHUNK, remaining))
-            if not data:
-                break
-            remaining -= len(data)
-            yield data
-    finally:
-        try:
-            fh.close()
-        except Exception:
-            pass
+    db.query(Share).filter(Share.media_id == media.id).delete(synchronize_session=False)
+    db.query(MediaReplica).filter(MediaReplica.media_id == media.id).delete(synchronize_session=False)
+    # el FK viejo (create_all no lo altera) no tiene ON DELETE SET NULL
+    db.query(UploadSession).filter(UploadSession.media_id == media.id).update(
+        {UploadSession.media_id: None}, synchronize_session=False
+    )
+    if media.storage_path and media.sha256:
+        orphan = release_blob(db, media.sha256)
+    else:
+        orphan = media_abs_path(media.rel_path)  # archivo legado: no compartido
+    db.delete(media)
+    db.commit()
+    invalidate_media_count(media.owner_id)
+    SEARCH_INDEX.discard(mid)
+    discard_file(orphan)
+    shutil.rmtree(hls_dir(mid), ignore_errors=True)  # paquete HLS: si no, sigue servible con un play token
+    return {"ok": True}
 
 def can_view_media(user, media: MediaFile) -> bool:
     # Propietario o admin
@@ -236,14 +419,13 @@ def stream_media(
     if not can_view_media(user, media):
         raise HTTPException(403, "Sin permiso para ver este archivo")
 
-    path = media_abs_path(media.rel_path)
+    path = media_storage_path(media)
     if not path.exists():
         raise HTTPException(404, "Archivo no existe en disco")
 
     # usa MIME guardado, con fallback por extensión
     mime = media.mime or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
-    start, end, length, headers, fh = open_range(path, request.headers.get("range"), mime)
-    return StreamingResponse(stream_iter(fh, length), status_code=206, headers=headers, media_type=mime)
+    return serve_file(request, path, mime, etag=media_etag(media), partial_without_range=True)
 
 
 @router.post("/{mid}/share", response_model=ShareOut, status_code=201)
@@ -299,11 +481,10 @@ def stream_by_token(token: str, request: Request, db: Session = Depends(get_db))
     if not media:
         raise HTTPException(404, "Media no encontrada")
 
-    path = media_abs_path(media.rel_path)
+    path = media_storage_path(media)
     if not path.exists():
         raise HTTPException(404, "Archivo no existe en disco")
 
     mime = media.mime or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
-    start, end, length, headers, fh = open_range(path, request.headers.get("range"), mime)
-    return StreamingResponse(stream_iter(fh, length), status_code=206, headers=headers, media_type=mime)
+    return serve_file(request, path, mime, etag=media_etag(media), partial_without_range=True)
 
@@ -1,5 +1,4 @@
 from datetime import datetime, timedelta, timezone
-from pathlib import Path
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from sqlalchemy import select
@@ -7,8 +6,8 @@ import jwt  # PyJWT
 from ..auth import get_db, get_current_user
 from ..config import settings
 from ..models import MediaFile, User
-from .media import media_abs_path  # ya lo tienes
-from fastapi.responses import Response
+from ..streaming import serve_file
+from .media import media_storage_path, media_etag, hls_dir
 
 router = APIRouter(prefix="/media", tags=["media-signed"])
 
@@ -45,75 +44,61 @@ def create_signed_play(media_id: int, minutes: int = PLAY_TOKEN_TTL_MIN,
     token = jwt.encode(payload, settings.jwt_secret, algorithm="HS256")
 
     # URL de reproducción: sin auth header, válida para <video>/<audio>
-    play_url = f"{settings.public_base_url.rstrip('/')}/media/play/{token}"
-    return {"url": play_url, "expires_at": exp.isoformat()}
+    base = settings.public_base_url.rstrip('/')
+    play_url = f"{base}/media/play/{token}"
+    # si ya existe paquete HLS (job 'package'), también la URL adaptativa
+    hls_url = f"{base}/media/hls/{token}/master.m3u8" if (hls_dir(media.id) / "master.m3u8").exists() else None
+    return {"url": play_url, "hls_url": hls_url, "expires_at": exp.isoformat()}
 
-@router.get("/play/{token}")
-def play_by_token(token: str, request: Request, db: Session = Depends(get_db)):
-    # 1) Validar token
+def _decode_play_token(token: str) -> dict:
     try:
-        data = jwt.decode(token, settings.jwt_secret, algorithms=["HS256"], audience=PLAY_TOKEN_AUD)
+        return jwt.decode(token, settings.jwt_secret, algorithms=["HS256"], audience=PLAY_TOKEN_AUD)
     except jwt.ExpiredSignatureError:
         raise HTTPException(401, "Link expired")
     except Exception:
         raise HTTPException(401, "Invalid token")
 
+@router.get("/play/{token}")
+def play_by_token(token: str, request: Request, db: Session = Depends(get_db)):
+    # 1) Validar token
+    data = _decode_play_token(token)
+
     mid = int(data["mid"])
     media = db.get(MediaFile, mid)
     if not media:
         raise HTTPException(404, "Not found")
 
     # 2) Abrir archivo
-    abs_path = media_abs_path(media.rel_path)
-    if not Path(abs_path).exists():
+    abs_path = media_storage_path(media)
+    if not abs_path.exists():
         raise HTTPException(404, "File missing on node")
 
-    # 3) Headers básicos
-    size = Path(abs_path).stat().st_size
+    # 3) Streaming por rangos con validadores (ETag/Last-Modified, If-Range, 304)
     mime = media.mime or "application/octet-stream"
-    range_header = request.headers.get("range") or request.headers.get("Range")
+    return serve_file(
+        request, abs_path, mime, etag=media_etag(media),
+        headers={"Cache-Control": "private, max-age=0, must-revalidate"},
+    )
 
-    if not range_header:
-        headers = {
-            "Accept-Ranges": "bytes",
-            "Content-Length": str(size),
-            "Content-Type": mime,
-            "Cache-Control": "private, max-age=0, must-revalidate",
-        }
-        with open(abs_path, "rb") as fh:
-            return Response(fh.read(), status_code=200, headers=headers)
+HLS_MIME = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+}
 
-    # 4) Soporte HTTP Range (206)
-    try:
-        # ej. "bytes=0-" o "bytes=1000-4999"
-        unit, rng = range_header.split("=")
-        start_s, end_s = (rng.split("-") + [""])[:2]
-        start = int(start_s) if start_s else 0
-        end = int(end_s) if end_s else size - 1
-        end = min(end, size - 1)
-        if start > end or start >= size:
-            raise ValueError()
-    except Exception:
-        raise HTTPException(416, "Invalid Range")
-
-    length = end - start + 1
-    headers = {
-        "Content-Range": f"bytes {start}-{end}/{size}",
-        "Accept-Ranges": "bytes",
-        "Content-Length": str(length),
-        "Content-Type": mime,
-        "Cache-Control": "private, max-age=0, must-revalidate",
-    }
-
-    def _iter_file(pth, s, e, chunk=1024 * 1024):
-        with open(pth, "rb") as fh:
-            fh.seek(s)
-            remain = e - s + 1
-            while remain > 0:
-                data = fh.read(min(chunk, remain))
-                if not data:
-                    break
-                remain -= len(data)
-                yield data
+@router.get("/hls/{token}/{path:path}")
+def hls_by_token(token: str, path: str, request: Request):
+    """
+    Playlists y segmentos HLS con el mismo token de signed-play.
+    Las URIs de los playlists son relativas, así que el player resuelve todo bajo /media/hls/{token}/.
+    """
+    data = _decode_play_token(token)
+    root = hls_dir(int(data["mid"]))
+    target = (root / path).resolve()
+    if root not in target.parents or target.suffix not in HLS_MIME:
+        raise HTTPException(404, "Not found")
+    if not target.is_file():
+        raise HTTPException(404, "Media sin empaquetar")
 
-    return Response(_iter_file(abs_path, start, end), status_code=206, headers=headers)
+    # re-empaquetar reescribe los segmentos con los mismos nombres: nada es immutable,
+    # se revalida con ETag/Last-Modified (mtime) y un segmento sin cambios vuelve como 304
+    return serve_file(request, target, HLS_MIME[target.suffix], headers={"Cache-Control": "private, no-cache"})
@@ -1,10 +1,13 @@
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 from ..auth import get_db, require_roles
 from ..models import Node
 from ..schemas import NodeRegisterIn, HeartbeatIn, NodeOut
+from ..metrics import METRICS, minute_series
+from ..concurrency import aimd_update
+from ..node_registry import NODES
 
 router = APIRouter(prefix="/monitor", tags=["monitor"])
 
@@ -13,16 +16,22 @@ def register_node(data: NodeRegisterIn, db: Session = Depends(get_db)):
     node = db.scalar(select(Node).where(Node.name == data.name))
     if node:
         node.api_url = data.api_url or node.api_url
+        if data.slots:
+            node.slots = max(1, data.slots)
         db.commit()
         db.refresh(node)
+        NODES.put(node)
         return node
-    node = Node(name=data.name, api_url=data.api_url, last_seen=datetime.utcnow(), is_active=True)
+    node = Node(name=data.name, api_url=data.api_url, last_seen=datetime.utcnow(), is_active=True,
+                slots=max(1, data.slots or 1))
     db.add(node); db.commit(); db.refresh(node)
+    NODES.put(node)
     return node
 
 @router.post("/nodes/heartbeat")
 def heartbeat(data: HeartbeatIn, db: Session = Depends(get_db)):
-    node = db.scalar(select(Node).where(Node.name == data.name))
+    """Actualiza el estado en memoria (NODES); la fila de nodes se persiste en el flush."""
+    node = NODES.get(db, data.name)
     if not node:
         raise HTTPException(404, "Nodo no registrado")
     node.last_seen = datetime.utcnow()
@@ -30,10 +39,37 @@ def heartbeat(data: HeartbeatIn, db: Session = Depends(get_db)):
     node.mem_pct = data.mem_pct
     node.net_in = data.net_in
     node.net_out = data.net_out
-    db.commit()
+    if data.slots:
+        node.slots = max(1, data.slots)
+    # ventana de concurrencia adaptativa con las métricas recién llegadas
+    aimd_update(node, data.running, node.last_seen)
+    NODES.touch(node)
+    # leases de los jobs que el nodo sigue ejecutando y telemetría: se escriben en el flush
+    NODES.defer_leases(node.id, data.jobs)
+    METRICS.record(node.id, node.last_seen, data.cpu_pct, data.mem_pct, data.net_in, data.net_out)
     return {"ok": True}
 
 @router.get("/nodes", response_model=list[NodeOut])
 def list_nodes(db: Session = Depends(get_db), admin=Depends(require_roles(["admin"]))):
     rows = db.scalars(select(Node).order_by(Node.name)).all()
     return rows
+
+@router.get("/nodes/{name}/metrics")
+def node_metrics(
+    name: str,
+    minutes: int = Query(60, ge=1, le=48 * 60),
+    resolution: str = Query("minute", pattern="^(raw|minute)$"),
+    db: Session = Depends(get_db),
+    admin=Depends(require_roles(["admin"])),
+):
+    """
+    Historial de CPU/MEM/red del nodo.
+    raw: muestras de cada heartbeat (últimos ~10 min, las que recibió este proceso).
+    minute: un punto por minuto desde node_metrics (hasta 48 h).
+    """
+    node = NODES.get(db, name)
+    if not node:
+        raise HTTPException(404, "Nodo no encontrado")
+    since = datetime.utcnow() - timedelta(minutes=minutes)
+    points = METRICS.raw(node.id, since) if resolution == "raw" else minute_series(db, node.id, since)
+    return {"node": node.name, "resolution": resolution, "points": points}
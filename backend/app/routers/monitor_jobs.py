@@ -4,6 +4,8 @@ from sqlalchemy.orm import Session
 from sqlalchemy import select, func
 from ..auth import get_db, require_roles
 from ..models import Job, Node
+from ..streaming import STREAM_SLOTS
+from ..concurrency import allowed_slots
 
 router = APIRouter(prefix="/monitor", tags=["monitor"])
 
@@ -25,6 +27,9 @@ def summary(db: Session = Depends(get_db), admin=Depends(require_roles(["admin"]
             "id": n.id, "name": n.name, "last_seen": n.last_seen,
             "cpu_pct": n.cpu_pct, "mem_pct": n.mem_pct,
             "net_in": n.net_in, "net_out": n.net_out,
+            "slots": n.slots,
+            "throughput": round(n.throughput or 1.0, 2),
+            "allowed": allowed_slots(n),
             "score": score(n),
             "overloaded": (n.cpu_pct and n.cpu_pct > 85) or (n.mem_pct and n.mem_pct > 80)
         }
@@ -35,7 +40,8 @@ def summary(db: Session = Depends(get_db), admin=Depends(require_roles(["admin"]
 
     return {
         "jobs": {"total": total_jobs, "by_status": jobs_by_status},
-        "nodes": {"count": len(nodes_out), "least_score": least, "overloaded": overloaded_count, "items": nodes_out}
+        "nodes": {"count": len(nodes_out), "least_score": least, "overloaded": overloaded_count, "items": nodes_out},
+        "streams": {"active": STREAM_SLOTS.active, "max": STREAM_SLOTS.limit},
     }
 
 @router.get("/jobs")
@@ -44,7 +50,8 @@ def list_jobs(limit: int = 50, db: Session = Depends(get_db), admin=Depends(requ
     return [
         {
             "id": j.id, "type": j.type, "status": j.status,
-            "progress": j.progress, "assigned_node_id": j.assigned_node_id,
+            "progress": j.progress, "speed": j.speed, "eta_sec": j.eta_sec,
+            "assigned_node_id": j.assigned_node_id,
             "created_at": j.created_at, "started_at": j.started_at,
             "finished_at": j.finished_at, "error": j.error
         }
@@ -1,30 +1,65 @@
 # app/routers/monitor_sessions.py
-from fastapi import APIRouter, Depends
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func
+from sqlalchemy import select, func, tuple_
 from ..auth import get_db, require_roles
 from ..models import Session as SessionModel, User
 
 router = APIRouter(prefix="/monitor", tags=["monitor"])
 
+def _encode_cursor(created_at: datetime, sid: str) -> str:
+    return f"{created_at.isoformat()}|{sid}"
+
+def _decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        ts, sid = cursor.split("|", 1)
+        return datetime.fromisoformat(ts), sid
+    except ValueError:
+        raise HTTPException(400, "Cursor inválido")
+
 @router.get("/sessions")
-def sessions(db: Session = Depends(get_db), admin=Depends(require_roles(["admin"]))):
-    # últimas 100 sesiones
-    rows = db.scalars(
-        select(SessionModel).order_by(SessionModel.created_at.desc()).limit(100)
+def sessions(
+    limit: int = Query(100, ge=1, le=500),
+    cursor: str | None = Query(None, description="next_cursor de la página anterior"),
+    state: str = Query("all", pattern="^(all|active|expired)$"),
+    db: Session = Depends(get_db),
+    admin=Depends(require_roles(["admin"])),
+):
+    """
+    Sesiones más recientes primero, con el email en el mismo SELECT (JOIN).
+    Paginado keyset por (created_at, id): cada página es un range scan del índice.
+    """
+    now = datetime.utcnow()
+    q = (
+        select(SessionModel.id, SessionModel.user_id, User.email, SessionModel.created_at, SessionModel.expires_at)
+        .join(User, User.id == SessionModel.user_id, isouter=True)
+    )
+    if state == "active":
+        q = q.where(SessionModel.expires_at > now)
+    elif state == "expired":
+        q = q.where(SessionModel.expires_at <= now)
+    if cursor:
+        c_ts, c_id = _decode_cursor(cursor)
+        q = q.where(tuple_(SessionModel.created_at, SessionModel.id) < tuple_(c_ts, c_id))
+    rows = db.execute(
+        q.order_by(SessionModel.created_at.desc(), SessionModel.id.desc()).limit(limit + 1)
     ).all()
-    out = []
-    for s in rows:
-        # Intentar traer el email/usuario
-        u = db.scalar(select(User).where(User.id == s.user_id)) if getattr(s, "user_id", None) else None
-        out.append({
-            "id": s.id,
-            "user_id": s.user_id,
-            "user_email": getattr(u, "email", None) if u else None,
-            "created_at": s.created_at,
-            "expires_at": s.expires_at,
-            "is_active": getattr(s, "is_active", None)
-        })
-    # métrica básica: cuántas activas
-    active_cnt = db.scalar(select(func.count()).select_from(SessionModel).where(SessionModel.expires_at > func.now()))
-    return {"active": active_cnt or 0, "recent": out}
+
+    page = rows[:limit]
+    out = [
+        {
+            "id": sid,
+            "user_id": uid,
+            "user_email": email,
+            "created_at": created_at,
+            "expires_at": expires_at,
+            "is_active": expires_at is not None and expires_at > now,
+        }
+        for sid, uid, email, created_at, expires_at in page
+    ]
+    next_cursor = _encode_cursor(page[-1].created_at, page[-1].id) if len(rows) > limit else None
+
+    # métrica básica: cuántas activas (usa el índice de expires_at)
+    active_cnt = db.scalar(select(func.count()).select_from(SessionModel).where(SessionModel.expires_at > now))
+    return {"active": active_cnt or 0, "recent": out, "next_cursor": next_cursor}
@@ -0,0 +1,346 @@
+# app/routers/uploads.py
+import os
+import hashlib
+import threading
+from uuid import uuid4
+from pathlib import Path
+from datetime import datetime, timedelta
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+
+from ..auth import require_user, get_db
+from ..config import settings
+from ..db import SessionLocal
+from ..models import UploadSession, UploadPart, MediaFile
+from ..schemas import MediaOut, UploadCreateIn, UploadStatusOut
+from ..blobstore import store_blob
+from ..search import SEARCH_INDEX
+from .media import (
+    media_tmp_dir, sanitize_filename, guess_mime, media_out, new_media_from_blob, user_rel_path,
+    invalidate_media_count, UPLOAD_CHUNK, SNIFF_BYTES,
+)
+
+router = APIRouter(prefix="/media/uploads", tags=["media-uploads"])
+
+DEFAULT_PART_SIZE = 8 * 1024 * 1024     # 8 MiB
+MIN_PART_SIZE = 256 * 1024
+MAX_PART_SIZE = 256 * 1024 * 1024
+UPLOAD_TTL_HOURS = 24
+
+# === Helpers ===
+
+def _part_path(upload_id: str) -> Path:
+    return media_tmp_dir() / f"mp_{upload_id}.part"
+
+def _get_session(db: Session, upload_id: str, user, for_update: bool = False) -> UploadSession:
+    up = db.get(UploadSession, upload_id, with_for_update=for_update)
+    if not up or up.owner_id != user.id:
+        raise HTTPException(404, "Upload no encontrado")
+    return up
+
+def _ensure_open(up: UploadSession):
+    if up.status != "open":
+        raise HTTPException(409, f"Upload en estado '{up.status}'")
+    if datetime.utcnow() > up.expires_at:
+        raise HTTPException(410, "Upload expirado")
+
+def _part_bounds(up: UploadSession, part_no: int) -> tuple[int, int]:
+    """(offset, longitud esperada) de la parte dentro del archivo final."""
+    if part_no < 0 or part_no >= up.part_count:
+        raise HTTPException(400, f"Parte fuera de rango (0..{up.part_count - 1})")
+    offset = part_no * up.part_size
+    return offset, min(up.part_size, up.total_size - offset)
+
+def _status_out(db: Session, up: UploadSession) -> UploadStatusOut:
+    rows = db.execute(
+        select(UploadPart.part_no, UploadPart.size_bytes)
+        .where(UploadPart.session_id == up.id)
+        .order_by(UploadPart.part_no)
+    ).all()
+    return UploadStatusOut(
+        upload_id=up.id,
+        filename=up.filename,
+        size=up.total_size,
+        part_size=up.part_size,
+        part_count=up.part_count,
+        status=up.status,
+        received=[n for n, _ in rows],
+        received_bytes=sum(sz for _, sz in rows),
+        expires_at=up.expires_at,
+    )
+
+class _RunningHash:
+    """
+    sha256 del archivo armado, calculado a medida que llegan las partes: avanza por el
+    prefijo contiguo de partes recibidas (releídas del page cache recién escritas), así
+    /complete sólo hashea lo que falte. Es por proceso: si las partes llegaron a otro
+    proceso del coordinador, /complete termina leyendo el resto del disco.
+    """
+    def __init__(self):
+        self.h = hashlib.sha256()
+        self.head = b""
+        self.next_part = 0
+        self.received: set[int] = set()
+        self.lock = threading.Lock()
+
+_hashers: dict[str, _RunningHash] = {}
+_hashers_lock = threading.Lock()
+
+def _hasher(upload_id: str) -> _RunningHash:
+    with _hashers_lock:
+        return _hashers.setdefault(upload_id, _RunningHash())
+
+def _drop_hasher(upload_id: str) -> _RunningHash | None:
+    with _hashers_lock:
+        return _hashers.pop(upload_id, None)
+
+def _hash_parts(rh: _RunningHash, path: Path, part_size: int, total_size: int, all_parts: bool = False):
+    """
+    Avanza rh por las partes contiguas ya recibidas (o hasta el final con all_parts).
+    Sin all_parts no espera: si otra parte está hasheando, ésa (o /complete) seguirá.
+    """
+    if not rh.lock.acquire(blocking=all_parts):
+        return
+    try:
+        part_count = max(1, (total_size + part_size - 1) // part_size)
+        with open(path, "rb") as f:
+            while rh.next_part < part_count and (all_parts or rh.next_part in rh.received):
+                offset = rh.next_part * part_size
+                remaining = min(part_size, total_size - offset)
+                f.seek(offset)
+                while remaining:
+                    data = f.read(min(UPLOAD_CHUNK, remaining))
+                    if not data:
+                        raise OSError(f"archivo del upload truncado en {offset}")
+                    if not rh.head:
+                        rh.head = data[:SNIFF_BYTES]
+                    rh.h.update(data)
+                    remaining -= len(data)
+                rh.next_part += 1
+    finally:
+        rh.lock.release()
+
+def _pwrite(fh, offset: int, data: bytes):
+    fh.seek(offset)
+    fh.write(data)
+
+# === Endpoints ===
+
+@router.post("", response_model=UploadStatusOut, status_code=201)
+def create_upload(data: UploadCreateIn, ctx=Depends(require_user), db: Session = Depends(get_db)):
+    """
+    Abre una sesión de subida. El cliente luego envía las partes con
+    PUT /media/uploads/{id}/parts/{n} (en paralelo y en cualquier orden).
+    """
+    user, _, _ = ctx
+    if data.size <= 0:
+        raise HTTPException(400, "Archivo vacío")
+    if data.size > settings.max_upload_bytes:
+        raise HTTPException(413, f"Archivo demasiado grande (máximo {settings.max_upload_bytes} bytes)")
+    part_size = data.part_size or DEFAULT_PART_SIZE
+    part_size = max(MIN_PART_SIZE, min(MAX_PART_SIZE, part_size))
+
+    up = UploadSession(
+        id=str(uuid4()),
+        owner_id=user.id,
+        filename=sanitize_filename(data.filename or "upload.bin"),
+        total_size=data.size,
+        part_size=part_size,
+        status="open",
+        expires_at=datetime.utcnow() + timedelta(hours=UPLOAD_TTL_HOURS),
+    )
+    # reserva el archivo destino para escribir las partes por offset
+    with open(_part_path(up.id), "wb") as f:
+        f.truncate(data.size)
+
+    db.add(up); db.commit(); db.refresh(up)
+    return _status_out(db, up)
+
+@router.get("/{upload_id}", response_model=UploadStatusOut)
+def upload_status(upload_id: str, ctx=Depends(require_user), db: Session = Depends(get_db)):
+    """Partes ya recibidas: el cliente reanuda enviando sólo las que faltan."""
+    user, _, _ = ctx
+    up = _get_session(db, upload_id, user)
+    return _status_out(db, up)
+
+def _open_part(db: Session, upload_id: str, user, part_no: int) -> tuple[str, int, int, int, int]:
+    """
+    Valida la sesión y devuelve (id, part_size, total_size, offset, esperado).
+    Cierra db: la conexión vuelve al pool antes de recibir el cuerpo (puede tardar minutos).
+    """
+    try:
+        up = _get_session(db, upload_id, user)
+        _ensure_open(up)
+        offset, expected = _part_bounds(up, part_no)
+        return up.id, up.part_size, up.total_size, offset, expected
+    finally:
+        db.close()
+
+def _record_part(upload_id: str, part_no: int, written: int):
+    """Registra la parte recibida con una sesión nueva (la del request ya se cerró)."""
+    db = SessionLocal()
+    try:
+        part = db.scalar(
+            select(UploadPart).where(UploadPart.session_id == upload_id, UploadPart.part_no == part_no)
+        )
+        if part:
+            part.size_bytes = written
+            part.received_at = datetime.utcnow()
+            db.commit()
+        else:
+            db.add(UploadPart(session_id=upload_id, part_no=part_no, size_bytes=written))
+            try:
+                db.commit()
+            except IntegrityError:
+                # otra petición registró la misma parte en paralelo: los bytes son los mismos
+                db.rollback()
+    finally:
+        db.close()
+
+@router.put("/{upload_id}/parts/{part_no}")
+async def upload_part(
+    upload_id: str,
+    part_no: int,
+    request: Request,
+    ctx=Depends(require_user),
+    db: Session = Depends(get_db),
+):
+    """Cuerpo = bytes crudos de la parte. Reenviar una parte la sobrescribe."""
+    user, _, _ = ctx
+    up_id, part_size, total_size, offset, expected = await run_in_threadpool(
+        _open_part, db, upload_id, user, part_no
+    )
+
+    path = _part_path(up_id)
+    if not path.exists():
+        raise HTTPException(410, "Datos del upload no disponibles")
+
+    rh = _hasher(up_id)
+    if part_no in rh.received:
+        # reenvío de una parte: lo ya hasheado puede no valer, /complete rehace el hash
+        _drop_hasher(up_id)
+        rh = _hasher(up_id)
+
+    written = 0
+    with open(path, "r+b") as fh:
+        async for data in request.stream():
+            if not data:
+                continue
+            if written + len(data) > expected:
+                raise HTTPException(400, f"La parte {part_no} excede {expected} bytes")
+            await run_in_threadpool(_pwrite, fh, offset + written, data)
+            written += len(data)
+
+    if written != expected:
+        raise HTTPException(400, f"Parte {part_no} incompleta: {written}/{expected} bytes")
+
+    await run_in_threadpool(_record_part, up_id, part_no, written)
+
+    rh.received.add(part_no)
+    try:
+        await run_in_threadpool(_hash_parts, rh, path, part_size, total_size)
+    except OSError:
+        _drop_hasher(up_id)  # /complete lo rehace desde el disco
+    return {"ok": True, "part_no": part_no, "size": written}
+
+@router.post("/{upload_id}/complete", response_model=MediaOut, status_code=201)
+def complete_upload(upload_id: str, ctx=Depends(require_user), db: Session = Depends(get_db)):
+    """
+    Verifica que estén todas las partes y registra el MediaFile.
+    Idempotente: si el upload ya se completó devuelve el mismo media (reintento del cliente).
+    Síncrono a propósito: FastAPI lo corre en el threadpool (hash, blobstore y DB bloquean).
+    """
+    user, _, _ = ctx
+    up = _get_session(db, upload_id, user, for_update=True)
+    if up.status == "done" and up.media_id is not None:
+        media = db.get(MediaFile, up.media_id)
+        if media:
+            return media_out(media)
+    _ensure_open(up)
+
+    received = set(db.scalars(select(UploadPart.part_no).where(UploadPart.session_id == up.id)).all())
+    missing = [n for n in range(up.part_count) if n not in received]
+    if missing:
+        raise HTTPException(409, f"Faltan partes: {missing[:50]}")
+
+    src = _part_path(up.id)
+    if not src.exists():
+        raise HTTPException(410, "Datos del upload no disponibles")
+
+    # sólo se hashea lo que no se alcanzó a hashear mientras llegaban las partes
+    rh = _drop_hasher(up.id) or _RunningHash()
+    _hash_parts(rh, src, up.part_size, up.total_size, True)
+    digest, head = rh.h.hexdigest(), rh.head
+    mime = guess_mime(head, up.filename)
+    blob = store_blob(db, src, digest, up.total_size, mime)
+
+    media = new_media_from_blob(user.id, user_rel_path(user.id, up.filename), blob)
+    db.add(media)
+    db.flush()
+    up.status = "done"
+    up.media_id = media.id
+    db.commit()
+    db.refresh(media)
+    invalidate_media_count(user.id)
+    SEARCH_INDEX.add(media)
+    return media_out(media)
+
+@router.delete("/{upload_id}")
+def abort_upload(upload_id: str, ctx=Depends(require_user), db: Session = Depends(get_db)):
+    user, _, _ = ctx
+    up = _get_session(db, upload_id, user)
+    if up.status == "open":
+        up.status = "aborted"
+        db.commit()
+    _drop_hasher(up.id)
+    try:
+        os.unlink(_part_path(up.id))
+    except OSError:
+        pass
+    return {"ok": True}
+
+# === Limpieza de sesiones vencidas ===
+
+GC_BATCH = 500
+
+def purge_expired_uploads(db: Session) -> int:
+    """Borra sesiones vencidas (cualquier estado), sus partes y el .part en disco."""
+    ids = db.scalars(
+        select(UploadSession.id).where(UploadSession.expires_at < datetime.utcnow()).limit(GC_BATCH)
+    ).all()
+    if not ids:
+        return 0
+    db.execute(delete(UploadPart).where(UploadPart.session_id.in_(ids)))
+    db.execute(delete(UploadSession).where(UploadSession.id.in_(ids)))
+    db.commit()
+    for uid in ids:
+        _drop_hasher(uid)
+        _part_path(uid).unlink(missing_ok=True)
+    return len(ids)
+
+_gc: threading.Thread | None = None
+
+def _gc_loop():
+    stop = threading.Event()
+    while not stop.wait(max(30, settings.upload_gc_every_sec)):
+        db = SessionLocal()
+        try:
+            while purge_expired_uploads(db) == GC_BATCH:
+                pass
+        except Exception as e:
+            db.rollback()
+            print("[uploads] gc error:", e)
+        finally:
+            db.close()
+
+def start_upload_gc():
+    """Arranca (una vez por proceso) la limpieza periódica de uploads vencidos."""
+    global _gc
+    if _gc is not None:
+        return
+    _gc = threading.Thread(target=_gc_loop, name="upload-gc", daemon=True)
+    _gc.start()
@@ -1,135 +1,317 @@
-from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException
+import time
+from datetime import datetime
+import jwt  # PyJWT
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import select, text, func
-from sqlalchemy import text
+from sqlalchemy import select, insert, text, func
 from ..auth import get_db
-from ..models import Job, Node, JobLock
+from ..config import settings
+from ..models import Job, JobLock, MediaFile
+from ..dispatch import JOB_NOTIFIER
+from ..leases import lease_until
+from ..concurrency import allowed_slots, is_critical
+from ..node_registry import NODES
+from ..scheduler import running_backlog, typical_queued_cost, finish_score, learn_throughput
+from ..streaming import serve_file
+from .media import media_storage_path, media_etag
 
 
 router = APIRouter(prefix="/worker", tags=["worker"])
 
-CPU_OVER = 85.0
-MEM_OVER = 80.0
-STALE_SEC = 10 
+SCORE_MARGIN = 1.1
 
+# token por lease para GET /worker/media/{mid}/source (el endpoint además verifica el lease en la DB)
+SOURCE_TOKEN_AUD = "media-source"
+SOURCE_TOKEN_TTL_SEC = 6 * 3600
 
-def _node_load_score(n: Node) -> float:
-    """Score simple: menor es mejor. None -> 0 (trato preferente a nodos que aún no reportan)."""
-    cpu = n.cpu_pct if n.cpu_pct is not None else 0.0
-    mem = n.mem_pct if n.mem_pct is not None else 0.0
-    # ponderación: 60% CPU, 40% MEM
-    return 0.6*cpu + 0.4*mem
-
-def _is_overloaded(n: Node) -> bool:
-    return (n.cpu_pct is not None and n.cpu_pct > CPU_OVER) or (n.mem_pct is not None and n.mem_pct > MEM_OVER)
-
-def _active_nodes(db: Session):
-    now = datetime.utcnow()
-    cutoff = now - timedelta(seconds=STALE_SEC)
-    return db.scalars(
-        select(Node).where(Node.is_active == True, (Node.last_seen == None) | (Node.last_seen >= cutoff))
-    ).all()
-
-def _requeue_queued_from_overloaded(db: Session):
-    actives = _active_nodes(db)
-    if not actives: 
-        return 0
-    overloaded_ids = [n.id for n in actives if _is_overloaded(n)]
-    if not overloaded_ids:
-        return 0
-    rows = db.scalars(
-        select(Job).where(Job.status == "queued", Job.assigned_node_id.in_(overloaded_ids))
-    ).all()
-    for j in rows:
-        j.assigned_node_id = None
-    db.commit()
-    return len(rows)
-
-TAKE_ONE_SQL = text("""
-WITH cte AS (
-  SELECT id FROM jobs
-  WHERE status = 'queued'
-  ORDER BY created_at
-  FOR UPDATE SKIP LOCKED
-  LIMIT 1
+# Lease por lotes con prioridad y fair-share entre dueños:
+# - owners: dueños con jobs en cola, recorridos como skip-scan sobre ix_jobs_queue_owner
+#   (un salto O(log n) por dueño, no un barrido de la cola).
+# - heads: primeros :n jobs de cada dueño por (prioridad, antigüedad); turn = posición en su
+#   cola + jobs que ya tiene corriendo => round-robin entre dueños, penalizando al que ya ocupa nodos.
+# - localidad: un job con home_node de otro nodo vivo espera hasta locality_until;
+#   entre los elegibles se prefieren los locales. pinned => sólo home_node (transfer).
+# - orden global: prioridad, localidad, turno, costo (pesados primero en el nodo más
+#   rápido), antigüedad. Un lote de 5000 jobs de un usuario no bloquea el job único
+#   de otro: ambos tienen un job con turn 1.
+TAKE_BATCH_SQL = text("""
+WITH RECURSIVE owners AS (
+  (SELECT owner_id FROM jobs WHERE status = 'queued' ORDER BY owner_id LIMIT 1)
+  UNION ALL
+  SELECT (SELECT q.owner_id FROM jobs q
+          WHERE q.status = 'queued' AND q.owner_id > o.owner_id
+          ORDER BY q.owner_id LIMIT 1)
+  FROM owners o
+  WHERE o.owner_id IS NOT NULL
+),
+heads AS (
+  SELECT c.id, c.priority, c.created_at, c.cost, c.rn + r.running AS turn,
+         (c.home_node IS NULL OR c.home_node = :node_name) AS local
+  FROM owners o
+  CROSS JOIN LATERAL (
+    SELECT id, priority, created_at, home_node, cost,
+           row_number() OVER (ORDER BY priority DESC, created_at) AS rn
+    FROM jobs
+    WHERE status = 'queued' AND owner_id = o.owner_id
+      AND (not_before IS NULL OR not_before <= :now)
+      AND (home_node IS NULL OR home_node = :node_name
+           OR (NOT COALESCE(pinned, false)
+               AND (locality_until IS NULL OR locality_until <= :now
+                    OR NOT (home_node = ANY(CAST(:live_nodes AS text[]))))))
+      AND (NOT :local_only OR home_node = :node_name)
+    ORDER BY priority DESC, created_at
+    LIMIT :n
+  ) c
+  CROSS JOIN LATERAL (
+    SELECT count(*) AS running FROM jobs
+    WHERE status = 'running' AND owner_id = o.owner_id
+  ) r
+  WHERE o.owner_id IS NOT NULL
+),
+picked AS (
+  SELECT id FROM heads
+  ORDER BY priority DESC, local DESC, turn,
+           CASE WHEN :heavy_first THEN -COALESCE(cost, 0) ELSE COALESCE(cost, 0) END,
+           created_at
+  LIMIT :n
+),
+cte AS (
+  SELECT j.id FROM jobs j
+  JOIN picked p ON p.id = j.id
+  WHERE j.status = 'queued'
+  FOR UPDATE OF j SKIP LOCKED
 )
 UPDATE jobs j
 SET status = 'running',
     assigned_node_id = :node_id,
-    started_at = now()
+    started_at = :now,
+    lease_expires_at = :lease_until,
+    attempts = COALESCE(j.attempts, 0) + 1,
+    not_before = NULL
 FROM cte
 WHERE j.id = cte.id
-RETURNING j.id
+RETURNING j.id, j.type, j.payload, j.priority, j.created_at, j.home_node
 """)
 
+MAX_BATCH = 64
+MAX_WAIT_SEC = 60.0
+# razones por las que no tiene sentido esperar un job nuevo
+NO_WAIT_REASONS = {"overloaded", "no-slots"}
+ELIGIBLE_SLACK_SEC = 0.05
+
 @router.post("/next_job")
-def next_job(node_name: str, db: Session = Depends(get_db)):
+async def next_job(
+    node_name: str,
+    max_jobs: int = Query(1, ge=1, le=MAX_BATCH),
+    wait: float = Query(0.0, ge=0.0, le=MAX_WAIT_SEC, description="Long-poll: segundos a esperar un job"),
+    db: Session = Depends(get_db),
+):
+    """
+    Entrega hasta max_jobs jobs (limitado por los slots libres del nodo) en "jobs".
+    "job" se mantiene con el primero para workers que piden de a uno.
+    Con wait > 0, si no hay trabajo la petición queda abierta hasta que se encole
+    un job (JOB_NOTIFIER), un job en cola se vuelva elegible (vence su not_before o
+    locality_until) o venza el plazo; mientras espera no consulta la base.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        since = JOB_NOTIFIER.generation
+        res = await run_in_threadpool(_take_jobs, db, node_name, max_jobs)
+        if res["jobs"] or res.get("reason") in NO_WAIT_REASONS:
+            return res
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return res
+        # nadie avisa cuando vence un backoff o la espera por localidad: se despierta solo
+        soon = await run_in_threadpool(_next_eligible_in, db)
+        timeout = remaining if soon is None else min(remaining, soon + ELIGIBLE_SLACK_SEC)
+        if not await JOB_NOTIFIER.wait(since, timeout) and timeout >= remaining:
+            return res
+
+def _next_eligible_in(db: Session) -> float | None:
+    """Segundos hasta el próximo not_before/locality_until pendiente de un job en cola."""
+    now = datetime.utcnow()
+    try:
+        times = [
+            db.scalar(select(func.min(col)).where(Job.status == "queued", col > now))
+            for col in (Job.not_before, Job.locality_until)
+        ]
+    finally:
+        db.rollback()  # no retener la conexión durante la espera
+    times = [t for t in times if t is not None]
+    return (min(times) - now).total_seconds() if times else None
+
+def _take_jobs(db: Session, node_name: str, max_jobs: int) -> dict:
+    """
+    Un intento de asignación (sync: corre en el threadpool).
+    El estado de los nodos sale de NODES (memoria); a la DB sólo van el backlog
+    de 'running' (una consulta agrupada) y el lease.
+    """
     # 0) Nodo existente
-    node = db.scalar(select(Node).where(Node.name == node_name))
+    node = NODES.get(db, node_name)
     if not node:
         raise HTTPException(404, "Nodo no registrado")
 
-    # 1) Si el nodo está sobrecargado, no asignar trabajo
-    if _is_overloaded(node):
-        return {"job": None, "reason": "overloaded"}
-
-    # 2) Re-enfila jobs 'queued' asignados a nodos sobrecargados
-    _requeue_queued_from_overloaded(db)
+    # 1) Freno duro o sin slots libres: no asignar trabajo
+    #    (el re-encolado de jobs de nodos en freno lo hace el flusher de NODES)
+    if is_critical(node):
+        return {"job": None, "jobs": [], "reason": "overloaded"}
+    backlog = running_backlog(db)
+    free = allowed_slots(node) - backlog.get(node.id, (0, 0.0))[0]
+    if free <= 0:
+        return {"job": None, "jobs": [], "reason": "no-slots"}
 
-    # 3) Least-loaded: calcular score y comparar contra el mínimo en nodos activos
-    actives = _active_nodes(db)
-    if actives:
-        scores = [(n.id, _node_load_score(n)) for n in actives]
-        min_score = min(s for _, s in scores)
-        my_score = _node_load_score(node)
+    # 2) Makespan: entre los nodos activos con slots libres, el que terminaría antes
+    #    un job típico de la cola (backlog restante / throughput aprendido) se lleva el trabajo
+    actives = NODES.actives()
+    busy = None
+    heavy_first = True
+    candidates = [
+        a for a in actives
+        if a.id != node.id and not is_critical(a) and backlog.get(a.id, (0, 0.0))[0] < allowed_slots(a)
+    ]
+    if candidates:
+        typical = typical_queued_cost(db)
+        my_score = finish_score(node, backlog.get(node.id, (0, 0.0))[1], typical)
+        min_score = min(finish_score(a, backlog.get(a.id, (0, 0.0))[1], typical) for a in candidates)
         # margen para evitar vibraciones
-        EPS = 1e-3
-        if my_score > min_score + EPS:
-            # no soy el menor; cedo turno
-            return {"job": None, "reason": "not-least-loaded", "my_score": my_score, "min_score": min_score}
+        if my_score > min_score * SCORE_MARGIN + 1e-3:
+            # otro nodo terminaría antes: sólo tomo jobs cuyo media ya está en este nodo
+            busy = {"reason": "not-fastest", "my_score": round(my_score, 1), "min_score": round(min_score, 1)}
+        # el nodo más rápido toma primero los jobs pesados (LPT); los lentos, los livianos
+        heavy_first = (node.throughput or 1.0) >= max(a.throughput or 1.0 for a in candidates)
+
+    # 3) Tomar hasta n trabajos en una sola sentencia
+    n = min(max_jobs, free)
+    now = datetime.utcnow()
+    rows = db.execute(TAKE_BATCH_SQL, {
+        "node_id": node.id, "node_name": node.name, "n": n, "now": now,
+        "lease_until": lease_until(now), "local_only": busy is not None,
+        "live_nodes": [a.name for a in actives], "heavy_first": heavy_first,
+    }).all()
+    if not rows:
+        db.commit()
+        return {"job": None, "jobs": [], **(busy or {})}
+    rows = sorted(rows, key=lambda r: (-(r.priority or 0), r.created_at))
 
-    # 4) Tomar un trabajo: si hay 'queued' sin asignación o asignados a mí
-    rid = db.execute(TAKE_ONE_SQL, {"node_id": node.id}).scalar()
-    if not rid:
-        return {"job": None}
+    # Auditoría: locks en un solo INSERT
+    db.execute(insert(JobLock), [{"job_id": r.id, "node_id": node.id} for r in rows])
+    db.commit()
 
-    job = db.scalar(select(Job).where(Job.id == rid))
-    # Auditoría: lock
-    jl = JobLock(job_id=job.id, node_id=node.id)
-    db.add(jl); db.commit()
+    homes = {
+        name: (st.api_url if st else None)
+        for name in {r.home_node for r in rows if r.home_node and r.home_node != node.name}
+        for st in [NODES.get(db, name)]
+    }
+    jobs = [_job_out(r, node.name, homes) for r in rows]
+    return {"job": jobs[0], "jobs": jobs}
 
-    return {"job": {"id": job.id, "type": job.type, "payload": job.payload}}
+def _source_token(jid: int, node_name: str, mid: int) -> str:
+    return jwt.encode({
+        "aud": SOURCE_TOKEN_AUD,
+        "exp": int(time.time()) + SOURCE_TOKEN_TTL_SEC,
+        "jid": jid, "node": node_name, "mid": mid,
+    }, settings.jwt_secret, algorithm="HS256")
 
-@router.post("/jobs/{jid}/progress")
-def progress(jid: int, progress: float, db: Session = Depends(get_db)):
+def _job_out(r, node_name: str, homes: dict[str, str | None]) -> dict:
+    """
+    Job para el worker; si el media vive en otro nodo agrega de dónde traerlo.
+    source_token autoriza a bajar el media del payload mientras dure este lease.
+    """
+    job = {"id": r.id, "type": r.type, "payload": r.payload}
+    mid = r.payload.get("media_id") if isinstance(r.payload, dict) else None
+    if mid is not None:
+        job["source_token"] = _source_token(r.id, node_name, int(mid))
+    if r.home_node and r.home_node != node_name:
+        job["source"] = {"home_node": r.home_node, "base_url": homes.get(r.home_node)}
+    return job
+
+def _leased_job(db: Session, jid: int, node_name: str | None) -> Job:
+    """Job 'running' cuyo lease sigue siendo de node_name (si se indica)."""
     j = db.scalar(select(Job).where(Job.id == jid))
     if not j:
         raise HTTPException(404, "Job no encontrado")
     if j.status != "running":
-        raise HTTPException(400, "Job no está en ejecución")
+        raise HTTPException(409, "Job no está en ejecución (lease perdido)")
+    if node_name is not None:
+        st = NODES.get(db, node_name)
+        if j.assigned_node_id != (st.id if st else None):
+            raise HTTPException(409, "El lease del job pertenece a otro nodo")
+    return j
+
+@router.post("/jobs/{jid}/progress")
+def progress(
+    jid: int,
+    progress: float,
+    speed: float | None = None,
+    eta_sec: float | None = None,
+    node_name: str | None = None,
+    db: Session = Depends(get_db),
+):
+    j = _leased_job(db, jid, node_name)
+    j.lease_expires_at = lease_until()
     j.progress = max(0.0, min(100.0, progress))
+    # métricas de FFmpeg (-progress): velocidad relativa a tiempo real y ETA
+    j.speed = speed
+    j.eta_sec = eta_sec
     db.commit()
     return {"ok": True}
 
 @router.post("/jobs/{jid}/done")
-def done(jid: int, db: Session = Depends(get_db)):
-    j = db.scalar(select(Job).where(Job.id == jid))
-    if not j:
-        raise HTTPException(404, "Job no encontrado")
+def done(jid: int, node_name: str | None = None, db: Session = Depends(get_db)):
+    j = _leased_job(db, jid, node_name)
+    now = datetime.utcnow()
+    node = NODES.by_id(j.assigned_node_id) if j.assigned_node_id else None
+    if node:
+        # aprende el throughput real del nodo (costo estimado / duración); se persiste en el flush
+        learn_throughput(node, j, now)
+        NODES.touch(node)
     j.status = "done"
+    j.lease_expires_at = None
     j.progress = 100.0
-    j.finished_at = datetime.utcnow()
+    j.finished_at = now
     db.commit()
     return {"ok": True}
 
 @router.post("/jobs/{jid}/fail")
-def fail(jid: int, error: str, db: Session = Depends(get_db)):
-    j = db.scalar(select(Job).where(Job.id == jid))
-    if not j:
-        raise HTTPException(404, "Job no encontrado")
+def fail(jid: int, error: str, node_name: str | None = None, db: Session = Depends(get_db)):
+    j = _leased_job(db, jid, node_name)
     j.status = "failed"
+    j.lease_expires_at = None
     j.error = error[:8000]
     j.finished_at = datetime.utcnow()
     db.commit()
     return {"ok": True}
+
+def _check_source_access(db: Session, mid: int, node_name: str, token: str):
+    """403 salvo que token sea de node_name para mid y el job siga con lease de ese nodo."""
+    try:
+        claims = jwt.decode(token, settings.jwt_secret, algorithms=["HS256"], audience=SOURCE_TOKEN_AUD)
+    except Exception:
+        raise HTTPException(403, "Token de fuente inválido")
+    if claims.get("node") != node_name or claims.get("mid") != mid:
+        raise HTTPException(403, "Token de fuente inválido")
+    st = NODES.get(db, node_name)
+    j = db.get(Job, int(claims["jid"]))
+    if (
+        not st or not j or j.status != "running" or j.assigned_node_id != st.id
+        or not isinstance(j.payload, dict) or str(j.payload.get("media_id")) != str(mid)
+    ):
+        raise HTTPException(403, "El nodo no tiene un lease sobre este media")
+
+@router.get("/media/{mid}/source")
+def media_source(mid: int, node_name: str, token: str, request: Request, db: Session = Depends(get_db)):
+    """
+    Archivo fuente de un media para un nodo que tomó un job remoto (sin storage compartido).
+    Lo sirve el nodo que lo tiene (home_node); soporta Range.
+    Sólo con el source_token del job y mientras node_name tenga su lease.
+    """
+    _check_source_access(db, mid, node_name, token)
+    media = db.get(MediaFile, mid)
+    if not media:
+        raise HTTPException(404, "Media no encontrado")
+    path = media_storage_path(media)
+    if not path.is_file():
+        raise HTTPException(404, "Archivo no está en este nodo")
+    return serve_file(request, path, media.mime, etag=media_etag(media))
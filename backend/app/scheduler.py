@@ -0,0 +1,90 @@
+# app/scheduler.py
+"""
+Costo estimado de jobs y throughput aprendido por nodo.
+- cost: segundos de trabajo en un nodo de referencia (throughput 1.0), estimado al crear
+  el job con la duración del media (media_meta) o, sin ella, con su tamaño.
+- Node.throughput: promedio móvil (EWMA) de cost / segundos reales de los jobs terminados.
+- finish_score(): cuándo terminaría el nodo un job típico dado lo que ya tiene corriendo;
+  next_job entrega trabajo al nodo con menor score (minimiza makespan) en vez del
+  de menor CPU/MEM.
+"""
+from datetime import datetime
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from .models import Job, Node, MediaFile
+from .concurrency import allowed_slots
+
+# costo relativo a la duración del media según el formato destino
+TARGET_FACTOR = {
+    ".wav": 0.02, ".flac": 0.05, ".mp3": 0.08, ".aac": 0.08, ".m4a": 0.08,
+    ".ogg": 0.1, ".opus": 0.1,
+    ".mp4": 1.0, ".mov": 1.0, ".mkv": 1.0, ".avi": 0.8,
+    ".webm": 3.0,   # VP9: varias veces más lento que H.264
+}
+DEFAULT_FACTOR = 0.5
+PACKAGE_FACTOR = 2.5            # escalera HLS: varias rendiciones
+ASSUMED_BYTES_PER_SEC = 500_000  # ~4 Mbps, para estimar duración sin media_meta
+TRANSFER_BYTES_PER_SEC = 50_000_000
+REINDEX_SEC_PER_MEDIA = 0.3
+MIN_COST = 1.0
+
+THROUGHPUT_ALPHA = 0.2
+MIN_THROUGHPUT = 0.05
+MAX_THROUGHPUT = 50.0
+
+def _media_seconds(media: MediaFile) -> float:
+    if media.meta and media.meta.duration_sec:
+        return media.meta.duration_sec
+    return (media.size_bytes or 0) / ASSUMED_BYTES_PER_SEC
+
+def estimate_cost(db: Session, job_type: str, payload: dict, media: MediaFile | None) -> float:
+    if job_type == "transfer":
+        return max(MIN_COST, ((media.size_bytes or 0) if media else 0) / TRANSFER_BYTES_PER_SEC)
+    if job_type == "reindex":
+        q = select(func.count()).select_from(MediaFile)
+        if payload.get("owner_id") is not None:
+            q = q.where(MediaFile.owner_id == int(payload["owner_id"]))
+        return max(MIN_COST, (db.scalar(q) or 0) * REINDEX_SEC_PER_MEDIA)
+    if not media:
+        return MIN_COST
+    if job_type == "package":
+        factor = PACKAGE_FACTOR
+    else:
+        ext = str(payload.get("target_ext") or "").lower().strip()
+        factor = TARGET_FACTOR.get(ext if ext.startswith(".") else "." + ext, DEFAULT_FACTOR)
+    return max(MIN_COST, _media_seconds(media) * factor)
+
+def learn_throughput(node: Node, job: Job, finished_at: datetime):
+    """Actualiza la EWMA del nodo con un job terminado (no hace commit)."""
+    if not job.started_at or not job.cost:
+        return
+    elapsed = (finished_at - job.started_at).total_seconds()
+    if elapsed <= 0:
+        return
+    sample = max(MIN_THROUGHPUT, min(MAX_THROUGHPUT, job.cost / elapsed))
+    prev = node.throughput or 1.0
+    node.throughput = (1 - THROUGHPUT_ALPHA) * prev + THROUGHPUT_ALPHA * sample
+
+def running_backlog(db: Session) -> dict[int, tuple[int, float]]:
+    """node_id -> (jobs corriendo, costo restante) en una sola consulta."""
+    rows = db.execute(
+        select(
+            Job.assigned_node_id,
+            func.count(),
+            func.coalesce(func.sum(Job.cost * (1.0 - Job.progress / 100.0)), 0.0),
+        )
+        .where(Job.status == "running", Job.assigned_node_id != None)
+        .group_by(Job.assigned_node_id)
+    ).all()
+    return {nid: (cnt, float(rest)) for nid, cnt, rest in rows}
+
+def typical_queued_cost(db: Session) -> float:
+    avg = db.scalar(select(func.avg(Job.cost)).where(Job.status == "queued"))
+    return float(avg) if avg else MIN_COST
+
+def finish_score(n: Node, backlog: float, job_cost: float) -> float:
+    """Segundos estimados hasta que n termine job_cost además de su backlog."""
+    rate = max(MIN_THROUGHPUT, n.throughput or 1.0) * allowed_slots(n)
+    return (backlog + job_cost) / rate
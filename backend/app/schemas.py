@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
 
 class LoginIn(BaseModel):
@@ -29,6 +29,46 @@ class MediaOut(BaseModel):
     sha256: str | None = None
     node_home: str
     created_at: datetime
+    duration_sec: float | None = None   # de media_meta (job 'reindex')
+
+class MediaSearchOut(MediaOut):
+    score: float                        # relevancia 0..1 (similitud de trigramas)
+
+class MediaByHashIn(BaseModel):
+    sha256: str
+    filename: str
+    size: int | None = None         # si se envía, debe coincidir con el blob
+    # prueba de posesión (obligatoria si el usuario no referencia ya el blob):
+    # challenge de POST /media/by-hash/challenge y proof = sha256(nonce + bytes[offset:offset+length])
+    challenge: str | None = None
+    proof: str | None = None
+
+class BlobChallengeIn(BaseModel):
+    sha256: str
+    size: int
+
+class BlobChallengeOut(BaseModel):
+    challenge: str
+    nonce: str
+    offset: int
+    length: int
+
+# === Uploads reanudables ===
+class UploadCreateIn(BaseModel):
+    filename: str
+    size: int                       # bytes totales del archivo
+    part_size: int | None = None    # None => default del servidor
+
+class UploadStatusOut(BaseModel):
+    upload_id: str
+    filename: str
+    size: int
+    part_size: int
+    part_count: int
+    status: str
+    received: list[int]             # números de parte ya recibidos (0-based)
+    received_bytes: int
+    expires_at: datetime
 
 class ShareIn(BaseModel):
     scope: str = "public"            # 'public' | 'private' | 'org'
@@ -46,6 +86,7 @@ class ShareOut(BaseModel):
 class NodeRegisterIn(BaseModel):
     name: str
     api_url: str | None = None
+    slots: int | None = None        # jobs simultáneos que acepta el nodo
 
 class HeartbeatIn(BaseModel):
     name: str
@@ -53,6 +94,9 @@ class HeartbeatIn(BaseModel):
     mem_pct: float | None = None
     net_in: int | None = None
     net_out: int | None = None
+    slots: int | None = None
+    running: int | None = None      # jobs en ejecución según el worker
+    jobs: list[int] | None = None   # ids en ejecución: renueva sus leases
 
 class NodeOut(BaseModel):
     id: int
@@ -63,12 +107,16 @@ class NodeOut(BaseModel):
     mem_pct: float | None
     net_in: int | None
     net_out: int | None
+    slots: int = 1
+    throughput: float = 1.0
+    conc_limit: float = 1.0
     is_active: bool
 
 # === Jobs ===
 class JobCreateIn(BaseModel):
-    type: str  # convert | transfer | reindex
+    type: str  # convert | package | transfer | reindex
     payload: dict
+    priority: int = Field(0, ge=-100, le=100)  # interactivo 10, normal 0, lote -10
 
 class JobOut(BaseModel):
     id: int
@@ -77,7 +125,15 @@ class JobOut(BaseModel):
     status: str
     assigned_node_id: int | None
     progress: float
+    speed: float | None = None
+    eta_sec: float | None = None
     created_at: datetime
     started_at: datetime | None
     finished_at: datetime | None
     error: str | None
+    lease_expires_at: datetime | None = None
+    attempts: int = 0
+    owner_id: int = 0
+    priority: int = 0
+    home_node: str | None = None
+    cost: float = 1.0
@@ -0,0 +1,181 @@
+# app/search.py
+"""
+Búsqueda de medios por nombre (rel_path) y etiquetas de ffprobe (media_meta.tags).
+- Postgres: extensión pg_trgm + índices GIN de trigramas sobre lower(rel_path) y
+  lower(tags). Candidatos = UNION de una subconsulta por tabla con LIKE '%q%' o
+  `q <% texto` (cada una usa su índice); luego se une y ordena por word_similarity:
+  la latencia no crece con el tamaño de la biblioteca.
+- Sin pg_trgm (SQLite de desarrollo o sin permisos para la extensión): índice
+  invertido trigrama -> ids en memoria, armado desde la DB al primer uso y
+  reconstruido cada REBUILD_SEC; las altas/bajas de este proceso se aplican al vuelo.
+"""
+import re
+import time
+import threading
+from collections import Counter
+
+from sqlalchemy import select, text, func, or_, literal, union
+from sqlalchemy.orm import Session
+
+from .db import engine
+from .models import MediaFile, MediaMeta
+
+MIN_SCORE = 0.6          # igual que pg_trgm.word_similarity_threshold por defecto
+REBUILD_SEC = 300
+
+_TRGM_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_media_rel_path_trgm ON media_files USING gin (lower(rel_path) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_media_meta_tags_trgm ON media_meta USING gin (lower(tags) gin_trgm_ops)",
+)
+
+_trgm = False
+_WORD = re.compile(r"[^\W_]+")
+
+def trigrams(s: str) -> frozenset[str]:
+    """Trigramas como pg_trgm: por palabra alfanumérica, en minúsculas y con relleno."""
+    out = set()
+    for w in _WORD.findall(s.lower()):
+        w = f"  {w} "
+        out.update(w[i:i + 3] for i in range(len(w) - 2))
+    return frozenset(out)
+
+def _document(rel_path: str, tags: str | None) -> str:
+    return f"{rel_path} {tags}" if tags else rel_path
+
+def _like_pattern(q: str) -> str:
+    q = q.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{q}%"
+
+# === Índice en memoria (fallback) ===
+
+class MemoryIndex:
+    def __init__(self):
+        self._postings: dict[str, set[int]] = {}
+        self._docs: dict[int, tuple[int, str, frozenset[str]]] = {}  # id -> (owner_id, texto, trigramas)
+        self._built_at: float | None = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _put(postings, docs, mid: int, owner_id: int, doc: str):
+        grams = trigrams(doc)
+        docs[mid] = (owner_id, doc.lower(), grams)
+        for g in grams:
+            postings.setdefault(g, set()).add(mid)
+
+    def _drop(self, mid: int):
+        doc = self._docs.pop(mid, None)
+        if not doc:
+            return
+        for g in doc[2]:
+            ids = self._postings.get(g)
+            if ids is not None:
+                ids.discard(mid)
+                if not ids:
+                    del self._postings[g]
+
+    def rebuild(self, db: Session):
+        rows = db.execute(
+            select(MediaFile.id, MediaFile.owner_id, MediaFile.rel_path, MediaMeta.tags)
+            .outerjoin(MediaMeta, MediaMeta.media_id == MediaFile.id)
+        ).all()
+        postings, docs = {}, {}
+        for mid, owner_id, rel_path, tags in rows:
+            self._put(postings, docs, mid, owner_id, _document(rel_path, tags))
+        with self._lock:
+            self._postings, self._docs = postings, docs
+            self._built_at = time.monotonic()
+
+    def add(self, media: MediaFile):
+        """Alta/cambio de un media en este proceso (no-op si el índice aún no se armó)."""
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._drop(media.id)
+            tags = media.meta.tags if media.meta else None
+            self._put(self._postings, self._docs, media.id, media.owner_id, _document(media.rel_path, tags))
+
+    def discard(self, mid: int):
+        with self._lock:
+            self._drop(mid)
+
+    def search(self, db: Session, q: str, owner_id: int | None, limit: int) -> list[tuple[int, float]]:
+        """[(media_id, score)] ordenado por relevancia."""
+        if self._built_at is None or time.monotonic() - self._built_at > REBUILD_SEC:
+            self.rebuild(db)
+        qgrams = trigrams(q)
+        ql = q.lower()
+        with self._lock:
+            hits = Counter()
+            for g in qgrams:
+                hits.update(self._postings.get(g, ()))
+            ranked = []
+            for mid, n in hits.items():
+                owner, doc, _ = self._docs[mid]
+                if owner_id is not None and owner != owner_id:
+                    continue
+                score = 1.0 if ql in doc else n / len(qgrams)
+                if score >= MIN_SCORE:
+                    ranked.append((mid, score))
+        ranked.sort(key=lambda r: (-r[1], -r[0]))
+        return ranked[:limit]
+
+SEARCH_INDEX = MemoryIndex()
+
+# === API ===
+
+def init_search():
+    """Al arrancar (después de create_all): extensión e índices de trigramas en Postgres."""
+    global _trgm
+    if engine.dialect.name != "postgresql":
+        return
+    try:
+        with engine.begin() as conn:
+            for ddl in _TRGM_DDL:
+                conn.execute(text(ddl))
+        _trgm = True
+    except Exception as e:
+        print("[search] pg_trgm no disponible, se usa el índice en memoria:", e)
+
+def _rank_pg(db: Session, q: str, owner_id: int | None, limit: int) -> list[tuple[MediaFile, float]]:
+    name = func.lower(MediaFile.rel_path)
+    tags = func.lower(MediaMeta.tags)
+    ql = q.lower()
+    pattern = _like_pattern(q)
+    # candidatos: una subconsulta por tabla, cada una resuelta con su índice GIN
+    # (un OR entre columnas de las dos tablas del outer join no puede usarlos)
+    by_name = select(MediaFile.id.label("id")).where(
+        or_(name.like(pattern, escape="\\"), literal(ql).op("<%")(name))
+    )
+    if owner_id is not None:
+        by_name = by_name.where(MediaFile.owner_id == owner_id)
+    by_tags = select(MediaMeta.media_id.label("id")).where(
+        or_(tags.like(pattern, escape="\\"), literal(ql).op("<%")(tags))
+    )
+    hits = union(by_name, by_tags).subquery()
+
+    # greatest() ignora NULL (media sin etiquetas)
+    score = func.greatest(func.word_similarity(ql, name), func.word_similarity(ql, tags))
+    stmt = (
+        select(MediaFile, score)
+        .join(hits, hits.c.id == MediaFile.id)
+        .outerjoin(MediaMeta, MediaMeta.media_id == MediaFile.id)
+        .order_by(score.desc(), MediaFile.created_at.desc())
+        .limit(limit)
+    )
+    if owner_id is not None:
+        stmt = stmt.where(MediaFile.owner_id == owner_id)
+    return [(m, float(s or 0.0)) for m, s in db.execute(stmt).all()]
+
+def rank_media(db: Session, q: str, owner_id: int | None, limit: int = 20) -> list[tuple[MediaFile, float]]:
+    """Medios que coinciden con q, del más al menos relevante, con su score (0..1)."""
+    q = q.strip()
+    if not q:
+        return []
+    if _trgm:
+        return _rank_pg(db, q, owner_id, limit)
+    ranked = SEARCH_INDEX.search(db, q, owner_id, limit)
+    if not ranked:
+        return []
+    rows = {m.id: m for m in db.scalars(select(MediaFile).where(MediaFile.id.in_([mid for mid, _ in ranked])))}
+    return [(rows[mid], score) for mid, score in ranked if mid in rows]
@@ -0,0 +1,308 @@
+# app/streaming.py
+"""
+Motor común de streaming para /media/{mid}/stream, /media/share/{token} y /media/play/{token}.
+- serve_file(): validadores (ETag/Last-Modified), 304, If-Range y rangos RFC 7233
+  (sufijos, varios rangos en multipart/byteranges).
+- RangeFileResponse: si el servidor ASGI anuncia la extensión "http.response.zerocopysend",
+  el kernel copia el rango directo del archivo al socket (os.sendfile).
+  Si no, lee el rango por bloques en un hilo (como FileResponse de Starlette).
+  En ambos casos la memoria por stream es acotada.
+- El cuerpo se envía desde el event loop: un stream largo no retiene un hilo del
+  threadpool de Starlette. Las lecturas usan un limitador propio (STREAM_IO_THREADS)
+  y hay un tope de streams simultáneos (MAX_STREAMS) para no ahogar al resto de la API.
+"""
+import os
+import threading
+from uuid import uuid4
+from pathlib import Path
+from email.utils import formatdate, parsedate_to_datetime
+
+import anyio
+from anyio import to_thread
+from fastapi import HTTPException, Request, status
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from .config import settings
+
+SEND_CHUNK = 1024 * 1024
+
+class StreamSlots:
+    """Contador thread-safe de streams activos (los handlers sync corren en hilos)."""
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.limit and self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active = max(0, self.active - 1)
+
+STREAM_SLOTS = StreamSlots(settings.max_streams)
+_io_limiter: anyio.CapacityLimiter | None = None
+
+def _stream_io_limiter() -> anyio.CapacityLimiter:
+    # se crea perezosamente dentro del event loop
+    global _io_limiter
+    if _io_limiter is None:
+        _io_limiter = anyio.CapacityLimiter(max(1, settings.stream_io_threads))
+    return _io_limiter
+
+def _read_at(fh, offset: int, n: int) -> bytes:
+    fh.seek(offset)
+    return fh.read(n)
+
+MAX_RANGES = 16  # más rangos que esto (tras fusionar) => se sirve el archivo completo
+
+def _unsatisfiable(file_size: int) -> HTTPException:
+    return HTTPException(
+        status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+        "Rango fuera de archivo",
+        headers={"Content-Range": f"bytes */{file_size}"},
+    )
+
+def parse_ranges(range_hdr: str, file_size: int) -> list[tuple[int, int]] | None:
+    """
+    Range de RFC 7233 -> lista de (start, end) inclusivos, recortados al archivo.
+    Soporta "a-b", "a-" y sufijos "-n" separados por comas; fusiona solapados/contiguos.
+    None => unidad desconocida (se ignora el header). 416 si ninguno es satisfacible.
+    """
+    unit, sep, spec = range_hdr.partition("=")
+    if not sep or unit.strip().lower() != "bytes":
+        return None
+
+    ranges: list[tuple[int, int]] = []
+    for raw in spec.split(","):
+        raw = raw.strip()
+        if not raw:
+            continue
+        a, dash, b = raw.partition("-")
+        a, b = a.strip(), b.strip()
+        try:
+            if not dash or (not a and not b):
+                raise ValueError(raw)
+            if not a:
+                # sufijo: últimos n bytes (ej. moov al final de un MP4)
+                n = int(b)
+                if n < 0:
+                    raise ValueError(raw)
+                if n == 0 or file_size == 0:
+                    continue
+                start, end = max(0, file_size - n), file_size - 1
+            else:
+                start = int(a)
+                end = int(b) if b else None
+                if start < 0 or (end is not None and end < start):
+                    raise ValueError(raw)
+                if start >= file_size:
+                    continue
+                end = file_size - 1 if end is None else min(end, file_size - 1)
+        except ValueError:
+            # Range mal formado -> 416
+            raise HTTPException(status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, "Range inválido")
+        ranges.append((start, end))
+
+    if not ranges:
+        raise _unsatisfiable(file_size)
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    if len(merged) > MAX_RANGES:
+        return [(0, file_size - 1)]
+    return merged
+
+def content_range(start: int, end: int, file_size: int) -> str:
+    return f"bytes {start}-{end}/{file_size}"
+
+# === Validadores / condicionales ===
+
+def file_validators(st: os.stat_result, etag: str | None = None) -> tuple[str, str]:
+    """(ETag, Last-Modified). Sin etag explícito se deriva de mtime+tamaño."""
+    tag = f'"{etag}"' if etag else f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    return tag, formatdate(st.st_mtime, usegmt=True)
+
+def _etag_matches(header: str, tag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # comparación débil (RFC 7232 §2.3.2): ignora el prefijo W/
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return tag.removeprefix("W/") in tags
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        return int(mtime) <= int(parsedate_to_datetime(header).timestamp())
+    except Exception:
+        return False
+
+def is_not_modified(request: Request, tag: str, mtime: float) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        return _etag_matches(inm, tag)
+    ims = request.headers.get("if-modified-since")
+    return bool(ims) and _not_modified_since(ims, mtime)
+
+def if_range_ok(request: Request, tag: str, mtime: float) -> bool:
+    """False => el recurso cambió: se ignora Range y se envía completo."""
+    hdr = request.headers.get("if-range")
+    if not hdr:
+        return True
+    hdr = hdr.strip()
+    if hdr.startswith('"') or hdr.startswith("W/"):
+        # If-Range exige comparación fuerte
+        return not hdr.startswith("W/") and hdr == tag
+    return _not_modified_since(hdr, mtime)
+
+def serve_file(
+    request: Request,
+    path: Path,
+    mime: str | None,
+    etag: str | None = None,
+    headers: dict | None = None,
+    partial_without_range: bool = False,
+) -> Response:
+    """
+    Respuesta única para todos los endpoints de media.
+    - Un rango => 206 con Content-Range.
+    - Varios rangos => 206 multipart/byteranges.
+    partial_without_range=True mantiene el comportamiento histórico de /stream y /share:
+    sin Range responde 206 con el archivo completo.
+    """
+    st = path.stat()
+    size = st.st_size
+    mime = mime or "application/octet-stream"
+    tag, last_mod = file_validators(st, etag)
+    base = {"ETag": tag, "Last-Modified": last_mod, "Accept-Ranges": "bytes", **(headers or {})}
+
+    if request.method in ("GET", "HEAD") and is_not_modified(request, tag, st.st_mtime):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=base)
+
+    if not STREAM_SLOTS.try_acquire():
+        raise HTTPException(
+            status.HTTP_503_SERVICE_UNAVAILABLE, "Demasiados streams activos",
+            headers={"Retry-After": "2"},
+        )
+    try:
+        return _build_file_response(request, path, size, mime, st, tag, base, partial_without_range)
+    except BaseException:
+        STREAM_SLOTS.release()
+        raise
+
+def _build_file_response(request, path, size, mime, st, tag, base, partial_without_range) -> "RangeFileResponse":
+    """Elige 200 / 206 simple / 206 multipart según Range e If-Range."""
+    range_hdr = request.headers.get("range")
+    ranges = None
+    if range_hdr and if_range_ok(request, tag, st.st_mtime):
+        ranges = parse_ranges(range_hdr, size)
+    if ranges is None and partial_without_range and size > 0:
+        ranges = [(0, size - 1)]
+
+    if not ranges:
+        base["Content-Length"] = str(size)
+        return RangeFileResponse(path, [(b"", 0, size)], status_code=200, headers=base, media_type=mime)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        base["Content-Range"] = content_range(start, end, size)
+        base["Content-Length"] = str(end - start + 1)
+        return RangeFileResponse(path, [(b"", start, end - start + 1)], status_code=206,
+                                 headers=base, media_type=mime)
+
+    # multipart/byteranges (RFC 7233 §4.1)
+    boundary = uuid4().hex
+    segments = []
+    for i, (start, end) in enumerate(ranges):
+        head = (
+            ("" if i == 0 else "\r\n")
+            + f"--{boundary}\r\n"
+            + f"Content-Type: {mime}\r\n"
+            + f"Content-Range: {content_range(start, end, size)}\r\n\r\n"
+        ).encode("latin-1")
+        segments.append((head, start, end - start + 1))
+    trailer = f"\r\n--{boundary}--\r\n".encode("latin-1")
+    total = sum(len(h) + n for h, _, n in segments) + len(trailer)
+    base["Content-Length"] = str(total)
+    return RangeFileResponse(path, segments, trailer=trailer, status_code=206, headers=base,
+                             media_type=f"multipart/byteranges; boundary={boundary}")
+
+class RangeFileResponse(Response):
+    """
+    Envía segmentos de un archivo: cada uno es (prefijo en bytes, offset, longitud).
+    Un rango simple es [(b"", start, length)]; multipart agrega los encabezados de parte
+    como prefijo y el cierre del boundary como trailer.
+    """
+    chunk_size = SEND_CHUNK
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        segments: list[tuple[bytes, int, int]],
+        trailer: bytes = b"",
+        status_code: int = 206,
+        headers: dict | None = None,
+        media_type: str | None = None,
+    ):
+        self.path = Path(path)
+        self.segments = segments
+        self.trailer = trailer
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self._send_all(scope, send)
+        finally:
+            # serve_file reservó el slot al construir la respuesta
+            STREAM_SLOTS.release()
+
+    async def _send_all(self, scope: Scope, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+        limiter = _stream_io_limiter()
+        fh = await to_thread.run_sync(open, self.path, "rb", limiter=limiter)
+        try:
+            for prefix, start, length in self.segments:
+                if prefix:
+                    await send({"type": "http.response.body", "body": prefix, "more_body": True})
+                if length <= 0:
+                    continue
+                if zerocopy:
+                    await send({
+                        "type": "http.response.zerocopysend",
+                        "file": fh,
+                        "offset": start,
+                        "count": length,
+                        "more_body": True,
+                    })
+                    continue
+                pos, end = start, start + length
+                while pos < end:
+                    data = await to_thread.run_sync(
+                        _read_at, fh, pos, min(self.chunk_size, end - pos), limiter=limiter
+                    )
+                    if not data:
+                        # archivo truncado mientras se enviaba
+                        break
+                    pos += len(data)
+                    await send({"type": "http.response.body", "body": data, "more_body": True})
+        finally:
+            fh.close()
+        await send({"type": "http.response.body", "body": self.trailer, "more_body": False})
@@ -0,0 +1,140 @@
+# app/transfer.py
+"""
+Descarga de media para el worker (jobs 'transfer' y fuentes remotas).
+- El origen es GET /worker/media/{mid}/source: del nodo home si corre su propia API
+  (NODE_API_URL); si no, del coordinador. Sin NODE_API_URL no hay copia nodo a nodo.
+- Descarga con varios GET con Range en paralelo, cada uno escribe en su offset
+  de un .part preasignado (un handle por hilo).
+- Verifica sha256 y publica con os.replace (nunca queda un archivo a medias en destino).
+"""
+import os
+import re
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+PART_SIZE = 8 * 1024 * 1024     # bytes por GET con Range
+PARALLEL = int(os.environ.get("TRANSFER_PARALLEL", "4"))
+RETRIES = 3
+READ_CHUNK = 1024 * 1024
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+class TransferError(RuntimeError):
+    pass
+
+def _probe_size(url: str, params: dict, timeout: float) -> tuple[int, bool]:
+    """(tamaño, soporta Range) pidiendo el primer byte."""
+    with requests.get(url, params=params, headers={"Range": "bytes=0-0"}, stream=True, timeout=timeout) as r:
+        if r.status_code == 206:
+            m = _CONTENT_RANGE.match(r.headers.get("Content-Range", ""))
+            if m and m.group(3) != "*":
+                return int(m.group(3)), True
+        r.raise_for_status()
+        return int(r.headers.get("Content-Length") or 0), False
+
+def _fetch_range(url, params, path: Path, start: int, end: int, timeout: float, on_bytes):
+    last_err = None
+    for _ in range(RETRIES):
+        got = 0
+        try:
+            with requests.get(url, params=params, headers={"Range": f"bytes={start}-{end}"},
+                              stream=True, timeout=timeout) as r:
+                if r.status_code != 206:
+                    raise TransferError(f"se esperaba 206 para {start}-{end}, llegó {r.status_code}")
+                m = _CONTENT_RANGE.match(r.headers.get("Content-Range", ""))
+                if not m or int(m.group(1)) != start:
+                    raise TransferError(f"Content-Range inesperado: {r.headers.get('Content-Range')}")
+                with open(path, "r+b") as fh:
+                    fh.seek(start)
+                    for chunk in r.iter_content(READ_CHUNK):
+                        fh.write(chunk)
+                        got += len(chunk)
+                        on_bytes(len(chunk))
+            if got != end - start + 1:
+                raise TransferError(f"rango {start}-{end} incompleto: {got} bytes")
+            return
+        except (requests.RequestException, TransferError) as e:
+            on_bytes(-got)  # se reintenta el rango completo
+            last_err = e
+    raise TransferError(f"rango {start}-{end} falló tras {RETRIES} intentos: {last_err}")
+
+def _fetch_whole(url, params, path: Path, timeout: float, on_bytes):
+    with requests.get(url, params=params, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        with open(path, "wb") as fh:
+            for chunk in r.iter_content(READ_CHUNK):
+                fh.write(chunk)
+                on_bytes(len(chunk))
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(READ_CHUNK)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+def parallel_fetch(
+    url: str,
+    dst: Path,
+    params: dict | None = None,
+    sha256: str | None = None,
+    size: int | None = None,
+    parallel: int = PARALLEL,
+    part_size: int = PART_SIZE,
+    on_progress=None,
+    timeout: float = 30,
+) -> int:
+    """
+    Descarga url en dst. Devuelve los bytes escritos.
+    params (ej. node_name + token del lease) viaja en cada GET, también en los de Range.
+    on_progress(done_bytes, total_bytes) se llama desde los hilos de descarga.
+    """
+    params = params or {}
+    total, ranged = _probe_size(url, params, timeout)
+    if size is not None and total and total != size:
+        raise TransferError(f"tamaño remoto {total} != esperado {size}")
+
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(dst.name + ".part")
+    lock = threading.Lock()
+    done = 0
+
+    def on_bytes(n: int):
+        nonlocal done
+        with lock:
+            done += n
+            cur = done
+        if on_progress and n > 0:
+            on_progress(cur, total)
+
+    try:
+        if not ranged or total <= part_size or parallel <= 1:
+            _fetch_whole(url, params, tmp, timeout, on_bytes)
+        else:
+            with open(tmp, "wb") as fh:
+                fh.truncate(total)
+            ranges = [(s, min(s + part_size, total) - 1) for s in range(0, total, part_size)]
+            with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="xfer") as pool:
+                futs = [pool.submit(_fetch_range, url, params, tmp, s, e, timeout, on_bytes) for s, e in ranges]
+                for f in futs:
+                    f.result()
+
+        written = tmp.stat().st_size
+        if total and written != total:
+            raise TransferError(f"descarga incompleta: {written}/{total} bytes")
+        if sha256:
+            got = _sha256(tmp)
+            if got != sha256.lower():
+                raise TransferError(f"sha256 no coincide: {got} != {sha256}")
+        os.replace(tmp, dst)
+        return written
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
@@ -1,13 +1,18 @@
-import os, time, json, psutil, requests
+import os, time, json, shutil, mimetypes, threading, psutil, requests
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from sqlalchemy import delete, insert
 from .config import settings
 from .models import Base
 from .db import engine, SessionLocal
-from .models import MediaFile
-from .routers.media import media_abs_path  # reusar helper
+from .models import MediaFile, MediaReplica, MediaMeta, Node
+from .routers.media import media_abs_path, media_storage_path, media_tmp_dir, new_media_from_blob, hls_dir  # reusar helpers
+from .blobstore import sha256_file, store_blob
+from .routers.jobs import job_log_path
+from .transfer import parallel_fetch
 
-from .MotorInterno import run_ffmpeg_convert, FFMPEG_BIN, FFMPEG_ERROR
+from .MotorInterno import run_ffmpeg_convert, run_ffmpeg_hls, probe_media, FFMPEG_BIN, FFMPEG_ERROR
 
 if FFMPEG_ERROR:
     # No continúes: la configuración de FFmpeg está mala.
@@ -19,9 +24,29 @@ print("[worker] usando ffmpeg:", FFMPEG_BIN)
 COORD = settings.coord_url if hasattr(settings, "coord_url") else os.environ.get("COORD_URL", "http://127.0.0.1:8000")
 NODE = settings.node_name
 HB_EVERY = int(os.environ.get("HEARTBEAT_SEC", "3"))
+# jobs simultáneos en este nodo: WORKER_SLOTS o, por defecto, un slot por núcleo
+SLOTS = settings.worker_slots or (os.cpu_count() or 1)
+# long-poll de /worker/next_job: el coordinador retiene la petición hasta que haya trabajo
+LONG_POLL_SEC = float(os.environ.get("LONG_POLL_SEC", "25"))
+
+_running = 0
+_running_lock = threading.Lock()
+_leased: set[int] = set()   # ids en ejecución: el heartbeat renueva sus leases
+
+def _running_inc():
+    global _running
+    with _running_lock:
+        _running += 1
+
+def _running_dec():
+    global _running
+    with _running_lock:
+        _running -= 1
 
 def register_node():
-    r = requests.post(f"{COORD}/monitor/nodes/register", json={"name": NODE, "api_url": None}, timeout=10)
+    # api_url: sólo si este nodo corre su propia API (node_api_url); si no, las fuentes salen del coordinador
+    api_url = settings.node_api_url.rstrip("/") or None
+    r = requests.post(f"{COORD}/monitor/nodes/register", json={"name": NODE, "api_url": api_url, "slots": SLOTS}, timeout=10)
     r.raise_for_status()
     print("[worker] registered:", r.json())
 
@@ -40,20 +65,88 @@ def heartbeat_loop():
                 "mem_pct": mem,
                 "net_in": int(net.bytes_recv - net_in),
                 "net_out": int(net.bytes_sent - net_out),
+                "slots": SLOTS,
+                "running": _running,
+                "jobs": sorted(_leased),
             }
             requests.post(f"{COORD}/monitor/nodes/heartbeat", json=payload, timeout=5)
         except Exception as e:
             print("[worker] heartbeat error:", e)
         time.sleep(HB_EVERY)
 
-def take_next_job():
-    r = requests.post(f"{COORD}/worker/next_job", params={"node_name": NODE}, timeout=10)
+def take_next_jobs(max_jobs: int = 1, wait: float = LONG_POLL_SEC) -> tuple[list, str | None]:
+    """(jobs, reason). Bloquea hasta `wait` segundos si no hay trabajo."""
+    r = requests.post(
+        f"{COORD}/worker/next_job",
+        params={"node_name": NODE, "max_jobs": max_jobs, "wait": wait},
+        timeout=wait + 10,
+    )
     r.raise_for_status()
-    return r.json().get("job")
+    data = r.json()
+    if "jobs" in data:
+        return data["jobs"], data.get("reason")
+    return ([data["job"]] if data.get("job") else []), data.get("reason")
 
-def ack_progress(jid, p): requests.post(f"{COORD}/worker/jobs/{jid}/progress", params={"progress": p}, timeout=10)
-def ack_done(jid):        requests.post(f"{COORD}/worker/jobs/{jid}/done", timeout=10)
-def ack_fail(jid, err):   requests.post(f"{COORD}/worker/jobs/{jid}/fail", params={"error": err[:8000]}, timeout=10)
+def ack_progress(jid, p, **extra):
+    params = {"progress": p, "node_name": NODE, **{k: v for k, v in extra.items() if v is not None}}
+    r = requests.post(f"{COORD}/worker/jobs/{jid}/progress", params=params, timeout=10)
+    if r.status_code == 409:
+        print(f"[worker] job {jid}: lease perdido ({r.text})")
+def ack_done(jid):        requests.post(f"{COORD}/worker/jobs/{jid}/done", params={"node_name": NODE}, timeout=10)
+def ack_fail(jid, err):   requests.post(f"{COORD}/worker/jobs/{jid}/fail", params={"error": err[:8000], "node_name": NODE}, timeout=10)
+
+PROGRESS_MIN_SEC = float(os.environ.get("PROGRESS_MIN_SEC", "2"))
+
+class ProgressReporter:
+    """
+    Callback para run_ffmpeg_*: reenvía el progreso de FFmpeg a /worker/jobs/{jid}/progress
+    mapeado al rango [lo, hi], como máximo una vez cada PROGRESS_MIN_SEC segundos.
+    """
+    def __init__(self, jid, lo=1.0, hi=95.0, min_interval=PROGRESS_MIN_SEC):
+        self.jid, self.lo, self.hi, self.min_interval = jid, lo, hi, min_interval
+        self._last_t = 0.0
+        self._last_p = None
+
+    def __call__(self, p: dict):
+        if p.get("pct") is None:
+            return
+        now = time.monotonic()
+        if now - self._last_t < self.min_interval and not p.get("done"):
+            return
+        pct = round(self.lo + (self.hi - self.lo) * p["pct"] / 100.0, 1)
+        if pct == self._last_p:
+            return
+        self._last_t, self._last_p = now, pct
+        try:
+            ack_progress(self.jid, pct, speed=p.get("speed"), eta_sec=p.get("eta_sec"))
+        except Exception as e:
+            print("[worker] progress error:", e)
+
+def source_url(base_url: str | None, mid: int) -> str:
+    """GET /worker/media/{mid}/source del nodo home si anunció api_url; si no, del coordinador."""
+    return f"{(base_url or COORD).rstrip('/')}/worker/media/{mid}/source"
+
+def fetch_remote_source(job, media) -> Path:
+    """
+    El job se tomó lejos de home_node (venció la espera por localidad): trae el media
+    a .tmp, verificado por sha256. Viene del nodo home sólo si éste corre su propia API
+    (NODE_API_URL); si no, del coordinador, que debe tener el archivo en su MEDIA_ROOT.
+    """
+    src = job.get("source") or {}
+    dst = media_tmp_dir() / f"src_job_{job['id']}"
+    parallel_fetch(source_url(src.get("base_url"), media.id), dst,
+                   params={"node_name": NODE, "token": job.get("source_token") or ""},
+                   sha256=media.sha256, size=media.size_bytes)
+    return dst
+
+def local_source(job, media) -> tuple[Path, bool]:
+    """(ruta del fuente, es_temporal). Usa la copia local si existe; si no, la trae."""
+    path = media_storage_path(media)
+    if path.exists():
+        return path, False
+    if job.get("source"):
+        return fetch_remote_source(job, media), True
+    raise RuntimeError(f"archivo fuente no existe en disco: {path}")
 
 def convert_job(db, job):
     # payload: {"media_id": 1, "target_ext": ".mp3"}
@@ -66,64 +159,223 @@ def convert_job(db, job):
     if not media:
         raise RuntimeError("media_id no existe")
 
-    src = Path(media_abs_path(media.rel_path))
-    if not src.exists():
-        raise RuntimeError(f"archivo fuente no existe en disco: {src}")
+    out_rel = str(Path(media.rel_path).with_suffix(target_ext))  # nombre lógico para DB
+    out_tmp = media_tmp_dir() / f"job_{job['id']}{target_ext}"   # FFmpeg escribe aquí; luego va al blobstore
+
+    src, src_tmp = local_source(job, media)
+    ack_progress(job["id"], 1.0)
+    try:
+        res = run_ffmpeg_convert(src, out_tmp, on_progress=ProgressReporter(job["id"]), log_path=job_log_path(job["id"]))
+    finally:
+        if src_tmp:
+            src.unlink(missing_ok=True)
+    if not res["ok"]:
+        out_tmp.unlink(missing_ok=True)
+        raise RuntimeError(f"ffmpeg falló: {res['stderr_tail']}")
+    ack_progress(job["id"], 95.0)
+
 
-    out_rel = str(Path(media.rel_path).with_suffix(target_ext))  # sigue siendo string relativo para DB
-    out_abs = Path(media_abs_path(out_rel))                     # <- asegúrate que sea Path
-    out_abs.parent.mkdir(parents=True, exist_ok=True)
+    # Registra como nuevo MediaFile (mismo owner; node_home = este nodo), deduplicado por sha256
+    digest = sha256_file(out_tmp)
+    mime = mimetypes.guess_type(out_rel)[0]
+    blob = store_blob(db, out_tmp, digest, out_tmp.stat().st_size, mime)
+    new_media = new_media_from_blob(media.owner_id, out_rel, blob)
+    new_media.node_home = NODE
+    db.add(new_media); db.commit()
 
+def package_job(db, job):
+    # payload: {"media_id": 1}  -> HLS multi-bitrate en MEDIA_ROOT/hls/<media_id>/
+    mid = int(job["payload"]["media_id"])
+    media = db.query(MediaFile).filter(MediaFile.id == mid).first()
+    if not media:
+        raise RuntimeError("media_id no existe")
 
+    # se arma en .tmp y se publica con un rename: nunca se sirve un paquete a medias
+    work = media_tmp_dir() / f"hls_job_{job['id']}"
+    shutil.rmtree(work, ignore_errors=True)
+
+    src, src_tmp = local_source(job, media)
     ack_progress(job["id"], 1.0)
-    res = run_ffmpeg_convert(src, out_abs)
+    try:
+        res = run_ffmpeg_hls(src, work, on_progress=ProgressReporter(job["id"]), log_path=job_log_path(job["id"]))
+    finally:
+        if src_tmp:
+            src.unlink(missing_ok=True)
+    if not res["ok"]:
+        shutil.rmtree(work, ignore_errors=True)
+        raise RuntimeError(f"ffmpeg HLS falló ({res.get('failed_variant')}): {res['stderr_tail']}")
     ack_progress(job["id"], 95.0)
 
+    # borrado mientras se empaquetaba: no re-publicar (delete_media ya quitó hls/<id>)
+    db.expire_all()
+    if not db.query(MediaFile.id).filter(MediaFile.id == mid).first():
+        shutil.rmtree(work, ignore_errors=True)
+        raise RuntimeError("media_id borrado durante el empaquetado")
 
-    # Registra como nuevo MediaFile (mismo owner; node_home = este nodo)
-    size = out_abs.stat().st_size if out_abs.exists() else None
-    new_media = MediaFile(
-        owner_id=media.owner_id,
-        rel_path=out_rel,
-        mime=None,
-        size_bytes=size,
-        sha256=None,
-        node_home=NODE
-    )
-    db.add(new_media); db.commit()
+    dst = hls_dir(mid)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    old = None
+    if dst.exists():
+        old = dst.with_name(f"{dst.name}.old_{job['id']}")
+        os.replace(dst, old)
+    os.replace(work, dst)
+    if old:
+        shutil.rmtree(old, ignore_errors=True)
+
+def transfer_job(db, job):
+    # payload: {"media_id": 1, "target_node": "<este nodo>", "move": false}
+    payload = job["payload"]
+    mid = int(payload["media_id"])
+    target = payload.get("target_node") or NODE
+    if target != NODE:
+        raise RuntimeError(f"transfer para {target} tomado por {NODE}")
+
+    media = db.query(MediaFile).filter(MediaFile.id == mid).first()
+    if not media:
+        raise RuntimeError("media_id no existe")
+
+    dst = media_storage_path(media)  # misma ruta relativa a MEDIA_ROOT en todos los nodos
+    if dst.exists() and (media.size_bytes is None or dst.stat().st_size == media.size_bytes):
+        print(f"[worker] transfer {mid}: ya está en {NODE}")
+    else:
+        home = db.query(Node).filter(Node.name == media.node_home).first()
+        report = ProgressReporter(job["id"])
+        ack_progress(job["id"], 1.0)
+        parallel_fetch(
+            source_url(home.api_url if home else None, mid), dst,
+            params={"node_name": NODE, "token": job.get("source_token") or ""},
+            sha256=media.sha256, size=media.size_bytes,
+            on_progress=lambda done, total: report({"pct": 100.0 * done / total if total else None}),
+        )
+
+    # réplica en este nodo; move => este nodo pasa a ser el home (el anterior queda como réplica)
+    old_home = media.node_home
+    if payload.get("move") and old_home != NODE:
+        media.node_home = NODE
+        _add_replica(db, mid, old_home)
+        db.query(MediaReplica).filter(MediaReplica.media_id == mid, MediaReplica.node_name == NODE).delete()
+    elif old_home != NODE:
+        _add_replica(db, mid, NODE)
+    db.commit()
+
+def _add_replica(db, mid: int, node_name: str):
+    exists = db.query(MediaReplica.id).filter(
+        MediaReplica.media_id == mid, MediaReplica.node_name == node_name
+    ).first()
+    if not exists:
+        db.add(MediaReplica(media_id=mid, node_name=node_name))
+
+REINDEX_BATCH = 200
+REINDEX_PARALLEL = int(os.environ.get("REINDEX_PARALLEL", str(min(8, (os.cpu_count() or 1) * 2))))
+
+def _probe_row(item):
+    mid, path = item
+    if not path.exists():
+        return mid, None
+    meta = probe_media(path)
+    return mid, ({"media_id": mid, "probed_at": datetime.utcnow(), **meta} if meta else None)
+
+def reindex_job(db, job):
+    # payload: {"owner_id": 1 | None, "only_missing": true}
+    payload = job["payload"] or {}
+    q = db.query(MediaFile.id, MediaFile.storage_path, MediaFile.rel_path)
+    if payload.get("owner_id") is not None:
+        q = q.filter(MediaFile.owner_id == int(payload["owner_id"]))
+    if payload.get("only_missing", True):
+        q = q.outerjoin(MediaMeta, MediaMeta.media_id == MediaFile.id).filter(MediaMeta.media_id == None)
+    rows = q.order_by(MediaFile.id).all()
+    total = len(rows)
+    ack_progress(job["id"], 1.0)
+
+    # ffprobe es un subproceso: un pool de hilos basta; se inserta por lotes
+    indexed = missing = 0
+    with ThreadPoolExecutor(max_workers=REINDEX_PARALLEL, thread_name_prefix="probe") as pool:
+        for i in range(0, total, REINDEX_BATCH):
+            batch = [(mid, media_abs_path(sp or rp)) for mid, sp, rp in rows[i:i + REINDEX_BATCH]]
+            metas = []
+            for mid, meta in pool.map(_probe_row, batch):
+                if meta:
+                    metas.append(meta)
+                else:
+                    missing += 1
+            if metas:
+                ids = [m["media_id"] for m in metas]
+                db.execute(delete(MediaMeta).where(MediaMeta.media_id.in_(ids)))
+                db.execute(insert(MediaMeta), metas)
+                db.commit()
+                indexed += len(metas)
+            done = min(total, i + REINDEX_BATCH)
+            ack_progress(job["id"], round(1.0 + 94.0 * done / total, 1))
+    print(f"[worker] reindex: {indexed} indexados, {missing} sin archivo local o ilegibles (de {total})")
+
+def run_job(job):
+    """Ejecuta un job en su propio hilo con su propia sesión de DB (Session no es thread-safe)."""
+    print("[worker] got job:", job)
+    with _running_lock:
+        _leased.add(job["id"])
+    db = SessionLocal()
+    try:
+        if job["type"] == "convert":
+            convert_job(db, job)
+        elif job["type"] == "package":
+            package_job(db, job)
+        elif job["type"] == "transfer":
+            transfer_job(db, job)
+        elif job["type"] == "reindex":
+            reindex_job(db, job)
+        else:
+            time.sleep(0.1)
+
+        ack_done(job["id"])
+        print("[worker] job done:", job["id"])
+    except Exception as e:
+        err = str(e)
+        print("[worker] job failed:", err)
+        ack_fail(job["id"], err)
+    finally:
+        with _running_lock:
+            _leased.discard(job["id"])
+        db.close()
 
 def main():
     register_node()
 
     # lanza heartbeat en segundo plano (thread simple)
-    import threading
     threading.Thread(target=heartbeat_loop, daemon=True).start()
 
-    db = SessionLocal()
-    try:
+    # un hilo por slot: FFmpeg corre en subprocesos, así que los hilos no compiten por el GIL
+    slots = threading.BoundedSemaphore(SLOTS)
+    print(f"[worker] slots: {SLOTS}")
+
+    def run_and_release(job):
+        try:
+            run_job(job)
+        finally:
+            _running_dec()
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=SLOTS, thread_name_prefix="job") as pool:
         while True:
-            job = take_next_job()
-            if not job:
-                time.sleep(1.0)
-                continue
-            print("[worker] got job:", job)
+            slots.acquire()  # espera a tener al menos un slot libre antes de pedir trabajo
+            free = 1
+            while free < SLOTS and slots.acquire(blocking=False):
+                free += 1
+            reason = None
             try:
-                if job["type"] == "convert":
-                    convert_job(db, job)
-                elif job["type"] == "transfer":
-                    # TODO: implementar si lo necesitas en Sprint 3 (mover archivo a otro nodo)
-                    time.sleep(0.5)
-                else:
-                    time.sleep(0.1)
-
-                ack_done(job["id"])
-                print("[worker] job done:", job["id"])
+                jobs, reason = take_next_jobs(free)  # un round trip para todos los slots libres
             except Exception as e:
-                err = str(e)
-                print("[worker] job failed:", err)
-                ack_fail(job["id"], err)
-    finally:
-        db.close()
+                print("[worker] next_job error:", e)
+                jobs, reason = [], "error"
+            for _ in range(free - len(jobs)):
+                slots.release()
+            if not jobs:
+                # el long-poll ya esperó; sólo se pausa si el coordinador respondió sin esperar
+                if reason:
+                    time.sleep(1.0)
+                continue
+            for job in jobs:
+                _running_inc()
+                pool.submit(run_and_release, job)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,65 @@
+from datetime import datetime
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, User, MediaFile, MediaMeta, UploadSession
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def _fk_on(dbapi_conn, _record):
+        dbapi_conn.execute("PRAGMA foreign_keys=ON")
+
+    Base.metadata.create_all(engine)
+    s = sessionmaker(bind=engine)()
+    try:
+        yield s
+    finally:
+        s.close()
+        engine.dispose()
+
+
+def test_delete_indexed_media(db):
+    user = User(email="a@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    media = MediaFile(owner_id=user.id, rel_path="u_1/a.mp3", size_bytes=10)
+    db.add(media)
+    db.flush()
+    db.add(MediaMeta(media_id=media.id, duration_sec=1.5, tags="title"))
+    db.commit()
+
+    media = db.get(MediaFile, media.id)
+    assert media.meta is not None
+    db.delete(media)
+    db.commit()
+
+    assert db.scalar(select(MediaFile)) is None
+    assert db.scalar(select(MediaMeta)) is None
+
+
+def test_delete_uploaded_media_clears_session(db):
+    user = User(email="b@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    media = MediaFile(owner_id=user.id, rel_path="u_1/b.mp4", size_bytes=10)
+    db.add(media)
+    db.flush()
+    up = UploadSession(id="u1", owner_id=user.id, filename="b.mp4", total_size=10, part_size=10,
+                       status="done", expires_at=datetime.utcnow(), media_id=media.id)
+    db.add(up)
+    db.commit()
+
+    db.delete(media)
+    db.commit()
+
+    db.expire_all()
+    assert db.get(UploadSession, "u1").media_id is None
@@ -147,12 +147,151 @@ class ApiClient:
             raise RuntimeError(f"Upload failed: {resp.status_code} {detail}")
 
         return resp.json()
-    
-    def list_media(self, page: int = 1, page_size: int = 20):
-        """GET /media (requiere Authorization). Devuelve el JSON paginado."""
+
+    # ---------- upload reanudable por partes ----------
+    def _upload_call(self, method: str, path: str, headers: Optional[Dict[str, str]] = None, **kw) -> Dict[str, Any]:
+        url = f"{self.base_url}{path}"
+        hdrs = self._auth_header() | (headers or {})
+        kw.setdefault("timeout", self.timeout)
+        resp = requests.request(method, url, headers=hdrs, **kw)
+        if resp.status_code not in (200, 201):
+            try:
+                detail = resp.json().get("detail", resp.text)
+            except Exception:
+                detail = resp.text
+            if resp.status_code in (401, 403):
+                raise RuntimeError("No autorizado. Inicia sesión.")
+            raise RuntimeError(f"Upload {method} {path} failed: {resp.status_code} {detail}")
+        return resp.json()
+
+    def upload_media_resumable(
+        self,
+        file_path: str,
+        upload_id: Optional[str] = None,
+        part_size: int = 8 * 1024 * 1024,
+        workers: int = 4,
+        retries: int = 3,
+        progress_cb=None,
+    ) -> dict:
+        """
+        Sube un archivo grande por partes en paralelo:
+          POST /media/uploads -> PUT /media/uploads/{id}/parts/{n} ... -> POST .../complete
+        Si se pasa upload_id, consulta qué partes ya recibió el servidor y sólo envía las faltantes.
+        progress_cb(total_bytes, sent_bytes) opcional para UI.
+        Devuelve el JSON del media creado (igual que upload_media).
+        """
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        import threading
+
+        self._ensure_token()
+        p = Path(file_path)
+        if not p.exists() or not p.is_file():
+            raise RuntimeError("Archivo no existe.")
+        total = p.stat().st_size
+
+        if upload_id:
+            st = self._upload_call("GET", f"/media/uploads/{upload_id}")
+        else:
+            st = self._upload_call(
+                "POST", "/media/uploads",
+                json={"filename": p.name, "size": total, "part_size": part_size},
+            )
+        upload_id = st["upload_id"]
+        psize = int(st["part_size"])
+        done = set(st.get("received", []))
+        pending = [n for n in range(int(st["part_count"])) if n not in done]
+
+        sent = int(st.get("received_bytes", 0))
+        lock = threading.Lock()
+
+        def send_part(n: int) -> int:
+            offset = n * psize
+            length = min(psize, total - offset)
+            with p.open("rb") as f:
+                f.seek(offset)
+                data = f.read(length)
+            last_err = None
+            for _ in range(max(1, retries)):
+                try:
+                    self._upload_call(
+                        "PUT", f"/media/uploads/{upload_id}/parts/{n}", data=data,
+                        headers={"Content-Type": "application/octet-stream"},
+                    )
+                    return length
+                except Exception as e:
+                    last_err = e
+            raise RuntimeError(f"Parte {n} falló (upload_id={upload_id}): {last_err}")
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [pool.submit(send_part, n) for n in pending]
+            for fut in as_completed(futures):
+                n_bytes = fut.result()
+                with lock:
+                    sent += n_bytes
+                if progress_cb:
+                    try:
+                        progress_cb(total, sent)
+                    except Exception:
+                        pass
+
+        # /complete termina el sha256 del archivo armado: si las partes llegaron a otro proceso
+        # del servidor puede releerlo entero. Es idempotente, así que se reintenta sin miedo.
+        complete_timeout = max(self.timeout, 60 + total / 20_000_000)
+        last_err = None
+        for _ in range(max(1, retries)):
+            try:
+                return self._upload_call("POST", f"/media/uploads/{upload_id}/complete", timeout=complete_timeout)
+            except requests.RequestException as e:
+                last_err = e
+        raise RuntimeError(f"No se pudo completar el upload {upload_id}: {last_err}")
+
+    # ---------- upload deduplicado (sha256) ----------
+    def upload_media_dedup(self, file_path: str, resumable_from: int = 64 * 1024 * 1024, progress_cb=None) -> dict:
+        """
+        Calcula el sha256 local e intenta registrar el media sin subir bytes
+        (POST /media/by-hash con la prueba de posesión del challenge); si el backend
+        no tiene ese contenido, sube normal o por partes según el tamaño.
+        """
+        import hashlib
+
+        self._ensure_token()
+        p = Path(file_path)
+        if not p.exists() or not p.is_file():
+            raise RuntimeError("Archivo no existe.")
+
+        h = hashlib.sha256()
+        with p.open("rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        size = p.stat().st_size
+
+        # prueba de posesión: sha256(nonce + rango elegido por el servidor)
+        ch = self._upload_call("POST", "/media/by-hash/challenge", json={"sha256": digest, "size": size})
+        with p.open("rb") as f:
+            f.seek(int(ch["offset"]))
+            chunk = f.read(int(ch["length"]))
+        proof = hashlib.sha256(ch["nonce"].encode() + chunk).hexdigest()
+        r = requests.post(
+            f"{self.base_url}/media/by-hash", headers=self._auth_header(), timeout=self.timeout,
+            json={"sha256": digest, "filename": p.name, "size": size,
+                  "challenge": ch["challenge"], "proof": proof},
+        )
+        if r.status_code in (200, 201):
+            return r.json()
+
+        if size >= resumable_from:
+            return self.upload_media_resumable(str(p), progress_cb=progress_cb)
+        return self.upload_media(str(p))
+
+    def list_media(self, page: int = 1, page_size: int = 20, cursor: Optional[str] = None):
+        """GET /media (requiere Authorization). Devuelve el JSON paginado.
+        cursor: next_cursor de la respuesta anterior (keyset, no depende de page)."""
         self._ensure_token()
         url = f"{self.base_url}/media"
         params = {"page": page, "page_size": page_size}
+        if cursor:
+            params["cursor"] = cursor
         r = requests.get(url, headers=self._auth_header(), params=params, timeout=self.timeout)
         if r.status_code != 200:
             try:
@@ -162,8 +301,41 @@ class ApiClient:
             raise RuntimeError(f"/media failed: {r.status_code} {detail}")
         return r.json()
 
+    def search_media(self, q: str, limit: int = 20, owner_id: Optional[int] = None):
+        """GET /media/search: medios ordenados por relevancia (cada item trae score)."""
+        self._ensure_token()
+        params = {"q": q, "limit": limit}
+        if owner_id is not None:
+            params["owner_id"] = owner_id
+        r = requests.get(f"{self.base_url}/media/search", headers=self._auth_header(),
+                         params=params, timeout=self.timeout)
+        if r.status_code != 200:
+            try:
+                detail = r.json().get("detail", r.text)
+            except Exception:
+                detail = r.text
+            raise RuntimeError(f"/media/search failed: {r.status_code} {detail}")
+        return r.json()
+
 
     
+    # ---- SIGNED PLAY: URL temporal sin JWT (y HLS si el media está empaquetado) ----
+    def signed_play(self, media_id: int, minutes: int = 30) -> Dict[str, Any]:
+        """
+        POST /media/{id}/signed-play
+        Devuelve {"url": ".../media/play/<token>", "hls_url": ".../master.m3u8" | None, "expires_at": ...}
+        """
+        self._ensure_token()
+        url = f"{self.base_url}/media/{media_id}/signed-play"
+        r = requests.post(url, headers=self._auth_header(), params={"minutes": minutes}, timeout=self.timeout)
+        if r.status_code != 200:
+            try:
+                detail = r.json().get("detail", r.text)
+            except Exception:
+                detail = r.text
+            raise RuntimeError(f"signed-play failed: {r.status_code} {detail}")
+        return r.json()
+
     # ---- STREAM: descarga parcial (bytes start-end, ambos inclusivos) ----
     def stream_range(self, media_id: int, start: int = 0, end: Optional[int] = None) -> Tuple[bytes, Dict[str, str], int]:
         self._ensure_token()
@@ -311,10 +483,11 @@ class ApiClient:
         return {"ok": True, "path": dest_path, "status": r.status_code, "bytes": total}
 
     # services/api_client.py (añadir)
-    def create_job(self, job_type: str, payload: dict) -> dict:
+    def create_job(self, job_type: str, payload: dict, priority: int = 0) -> dict:
+        """priority: 10 interactivo (el usuario espera el resultado), 0 normal, -10 lotes."""
         self._ensure_token()
         url = f"{self.base_url}/jobs"
-        body = {"type": job_type, "payload": payload}
+        body = {"type": job_type, "payload": payload, "priority": priority}
         r = requests.post(url, json=body, headers=self._auth_header(), timeout=self.timeout)
         if r.status_code not in (200, 201):
             raise RuntimeError(f"Create job failed [{r.status_code}]: {r.text}")
@@ -328,6 +501,15 @@ class ApiClient:
             raise RuntimeError(f"Get job failed [{r.status_code}]: {r.text}")
         return r.json()
 
+    def get_job_log(self, job_id: int, tail: int = 65536) -> str:
+        """Últimos `tail` bytes del log de FFmpeg del job (GET /jobs/{id}/log)."""
+        self._ensure_token()
+        url = f"{self.base_url}/jobs/{job_id}/log"
+        r = requests.get(url, headers=self._auth_header(), params={"tail": tail}, timeout=self.timeout)
+        if r.status_code != 200:
+            raise RuntimeError(f"Get job log failed [{r.status_code}]: {r.text}")
+        return r.text
+
      # ---------- Monitor/Dashboard ----------
     def monitor_nodes(self) -> dict:
         self._ensure_token()
@@ -392,14 +574,29 @@ class ApiClient:
             return {"_unavailable": True}
         raise RuntimeError(f"/monitor/jobs failed: {status} {txt}")
 
-    def monitor_sessions(self) -> dict | list:
-        status, data, txt = self._get_json("/monitor/sessions")
+    def monitor_sessions(self, limit: int = 100, cursor: str | None = None, state: str = "all") -> dict | list:
+        """Página de sesiones; para la siguiente pasar cursor=resp["next_cursor"]."""
+        params = {"limit": limit, "state": state}
+        if cursor:
+            params["cursor"] = cursor
+        status, data, txt = self._get_json("/monitor/sessions", params=params)
         if status == 200:
             return data
         if status == 404:
             return {"_unavailable": True}
         raise RuntimeError(f"/monitor/sessions failed: {status} {txt}")
 
+    def node_metrics(self, node_name: str, minutes: int = 60, resolution: str = "minute") -> dict:
+        """Historial CPU/MEM/red de un nodo. resolution: 'raw' (~10 min) | 'minute' (hasta 48 h)."""
+        status, data, txt = self._get_json(
+            f"/monitor/nodes/{node_name}/metrics", params={"minutes": minutes, "resolution": resolution}
+        )
+        if status == 200:
+            return data
+        if status == 404:
+            return {"_unavailable": True}
+        raise RuntimeError(f"/monitor/nodes/{node_name}/metrics failed: {status} {txt}")
+
     def monitor_summary(self) -> dict:
         status, data, txt = self._get_json("/monitor/summary")
         if status == 200: